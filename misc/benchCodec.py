@@ -0,0 +1,275 @@
+# Benchmark suite for the Insteon codec.
+#
+# Times decoding several kinds of received streams, both with the streaming
+# Decoder alone and through the PLM (decode and process into events), and
+# building outgoing frames with Switch.turn_on, Dimmer.ramp_on and
+# Dimmer.ramp_off. Each benchmark is warmed up, then repeated, and the best
+# and median times are reported per operation and, for streams, per byte.
+#
+# Results can be saved as JSON and compared with a saved run, which lists
+# each benchmark's change and exits with status 1 if any got slower than
+# the threshold.
+#
+# Run it from the top-level pyHome folder:
+#   python misc/benchCodec.py [--messages N] [--repeat R] [--warmup W]
+#                             [--only NAME] [--save FILE] [--compare FILE]
+
+import os
+import gc
+import sys
+import json
+import time
+import random
+import timeit
+import platform
+import argparse
+import xml.etree.ElementTree as ET
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from pyHome import Insteon
+
+
+###############################################################################
+# Traffic
+
+def std_frame(addr, cmd1=0x11, cmd2=0xFF, flags=0x2F):
+    return [0x02,0x50] + addr + [0x11,0x22,0x33,flags,cmd1,cmd2]
+
+def ext_frame(addr):
+    return [0x02,0x51] + addr + [0x11,0x22,0x33,0x1F,0x2E,0x00] + [0]*14
+
+def echo_frame(addr, extended=False):
+    if extended:
+        return [0x02,0x62] + addr + [0x1F,0x2E,0x00] + [0]*14 + [0x06]
+    return [0x02,0x62] + addr + [0x0F,0x11,0xFF,0x06]
+
+def random_addr(rng):
+    return [rng.randrange(256) for i in range(3)]
+
+def stream_clean(rng, count):
+    """ Only standard received (0x50) messages """
+    return [std_frame(random_addr(rng), rng.choice([0x11,0x13,0x2E]),
+                      rng.randrange(256)) for i in range(count)]
+
+def stream_mixed(rng, count):
+    """ Standard and extended received messages """
+    return [std_frame(random_addr(rng)) if rng.random() < 0.7
+            else ext_frame(random_addr(rng)) for i in range(count)]
+
+def stream_noisy(rng, count):
+    """ Standard messages with NAKs and runs of corrupted bytes """
+    frames = []
+    for i in range(count):
+        kind = rng.random()
+        if kind < 0.1:
+            frames.append([0x15])
+        elif kind < 0.2:
+            frames.append([rng.choice([0x00,0x02,0x7F,0xFF])
+                           for j in range(rng.randrange(1, 20))])
+        else:
+            frames.append(std_frame(random_addr(rng)))
+    return frames
+
+def stream_echo(rng, count):
+    """ Mostly echoed commands, as when sending a lot """
+    frames = []
+    for i in range(count):
+        kind = rng.random()
+        if kind < 0.7:
+            frames.append(echo_frame(random_addr(rng)))
+        elif kind < 0.8:
+            frames.append(echo_frame(random_addr(rng), extended=True))
+        else:
+            frames.append(std_frame(random_addr(rng)))
+    return frames
+
+STREAMS = [('clean', stream_clean), ('mixed', stream_mixed),
+           ('noisy', stream_noisy), ('echo', stream_echo)]
+
+
+###############################################################################
+# Stand-ins for the house
+
+class NullQueue(object):
+    def put(self, item, *args):
+        pass
+
+class NullPLM(object):
+    def send(self, msg, priority=None):
+        pass
+
+class NullLatency(object):
+    def start(self, msg, device):
+        pass
+
+class NullHouse(object):
+    """ Just enough of a House for the PLM and devices """
+    def __init__(self):
+        self.event_queue = NullQueue()
+        self.latency = NullLatency()
+        self.plm = NullPLM()
+    def route(self, device):
+        return self.plm
+
+
+def make_device(cls, house):
+    xml = ET.fromstring('<device name="Bench" room="Bench" type="Bench">'
+                        '<address>18:52:86</address><pos/><icon/></device>')
+    return cls(house, xml)
+
+
+###############################################################################
+# Benchmarks. Each setup returns (run function, operations, bytes).
+
+def decode_setup(frames):
+    data = "".join(chr(b) for f in frames for b in f)
+    def run():
+        decoder = Insteon.Decoder()
+        for frame in decoder.feed(data):
+            pass
+    return run, len(frames), len(data)
+
+def process_setup(frames):
+    data = "".join(chr(b) for f in frames for b in f)
+    plm = Insteon.PLM(NullHouse(), None)
+    def run():
+        plm.feed(data)
+    return run, len(frames), len(data)
+
+def encode_setup(method, args_list):
+    def run():
+        for args in args_list:
+            method(*args)
+    return run, len(args_list), None
+
+def benchmarks(count):
+    """ Get the (name, setup) pairs of every benchmark """
+    house = NullHouse()
+    switch = make_device(Insteon.Switch, house)
+    dimmer = make_device(Insteon.Dimmer, house)
+    rng = random.Random(0)
+
+    found = []
+    for name, make in STREAMS:
+        frames = make(rng, count)
+        found.append(('decode/' + name, lambda f=frames: decode_setup(f)))
+        found.append(('process/' + name, lambda f=frames: process_setup(f)))
+
+    levels = [(rng.randrange(101), rng.random() < 0.5) for i in range(count)]
+    ramps = [(rng.choice([0.1, 2., 10., 30.]), rng.randrange(101))
+             for i in range(count)]
+    times = [(t,) for t, level in ramps]
+    found.append(('encode/turn_on',
+                  lambda: encode_setup(switch.turn_on, levels)))
+    found.append(('encode/ramp_on',
+                  lambda: encode_setup(dimmer.ramp_on, ramps)))
+    found.append(('encode/ramp_off',
+                  lambda: encode_setup(dimmer.ramp_off, times)))
+    return found
+
+
+###############################################################################
+# Timing and reporting
+
+def measure(setup, warmup, repeat):
+    """ Time a benchmark, returning its results as a dict """
+    run, ops, nbytes = setup()
+    for i in range(warmup):
+        run()
+
+    times = []
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        for i in range(repeat):
+            start = timeit.default_timer()
+            run()
+            times.append(timeit.default_timer() - start)
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+
+    times.sort()
+    best = times[0]
+    median = times[len(times) // 2]
+    result = {'Ops': ops, 'Bytes': nbytes,
+              'Best us/op': 1e6 * best / ops,
+              'Median us/op': 1e6 * median / ops}
+    if nbytes:
+        result['Best ns/byte'] = 1e9 * best / nbytes
+        result['MB/s'] = nbytes / best / 1e6
+    return result
+
+
+def report(results):
+    print "%-18s %12s %12s %12s %10s" % ('Benchmark', 'Best us/op',
+                                        'Median us/op', 'ns/byte', 'MB/s')
+    for name in sorted(results):
+        r = results[name]
+        per_byte = '%12.1f' % r['Best ns/byte'] if 'Best ns/byte' in r \
+                   else '%12s' % '-'
+        mbs = '%10.2f' % r['MB/s'] if 'MB/s' in r else '%10s' % '-'
+        print "%-18s %12.3f %12.3f %s %s" % (name, r['Best us/op'],
+                                             r['Median us/op'], per_byte, mbs)
+
+
+def compare(results, baseline, threshold):
+    """
+    Print the change of each benchmark from a baseline and get the names of
+    those that are slower by more than threshold (a fraction)
+    """
+    print "\n%-18s %12s %12s %9s" % ('Benchmark', 'Base us/op', 'Now us/op',
+                                     'Change')
+    slower = []
+    for name in sorted(results):
+        if name not in baseline:
+            continue
+        base = baseline[name]['Best us/op']
+        now = results[name]['Best us/op']
+        change = now / base - 1.
+        flag = ''
+        if change > threshold:
+            slower.append(name)
+            flag = '  SLOWER'
+        print "%-18s %12.3f %12.3f %+8.1f%%%s" % (name, base, now,
+                                                  100. * change, flag)
+    return slower
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Insteon codec benchmarks")
+    parser.add_argument('--messages', type=int, default=5000,
+                        help="messages or commands per run (default 5000)")
+    parser.add_argument('--repeat', type=int, default=7,
+                        help="timed runs of each benchmark (default 7)")
+    parser.add_argument('--warmup', type=int, default=2,
+                        help="untimed runs first (default 2)")
+    parser.add_argument('--only', default=None,
+                        help="run benchmarks whose names contain this")
+    parser.add_argument('--save', default=None, help="save results as JSON")
+    parser.add_argument('--compare', default=None,
+                        help="compare with results saved by --save")
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help="slowdown that fails --compare (default 0.1)")
+    args = parser.parse_args()
+
+    results = {}
+    for name, setup in benchmarks(args.messages):
+        if args.only is None or args.only in name:
+            results[name] = measure(setup, args.warmup, args.repeat)
+    report(results)
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump({'Python': platform.python_version(),
+                       'Platform': platform.platform(),
+                       'Date': time.strftime("%Y-%m-%d %H:%M:%S"),
+                       'Messages': args.messages,
+                       'Results': results}, f, indent=2, sort_keys=True)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)['Results']
+        if compare(results, baseline, args.threshold):
+            sys.exit(1)
@@ -0,0 +1,135 @@
+# Compare deep-copied Message events with Insteon.Event records.
+#
+# Before Insteon.Event, each received 0x50 message was put on the House event
+# queue as a copy.deepcopy() of the parser Message, which carried the command
+# tables (dicts of lambdas and bound methods) built in Message.__init__.
+# LegacyMessage below rebuilds that object. The Event column runs the real
+# parser, Insteon.Message.process(), against a stub house and takes the event
+# off its queue. This runs each kind of event through a Queue.Queue at a
+# steady rate (1000 events/s by default) and reports the CPU used, the time
+# per event, and the memory held by queued events.
+#
+# Run it from the top-level pyHome folder (Linux only, for the memory use):
+#   python misc/benchEvents.py [events per second] [seconds]
+
+import os
+import sys
+import copy
+import time
+import Queue
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from pyHome import Insteon
+from pyHome.Insteon import message
+
+
+FRAME = [0x02,0x50,0x12,0x34,0x56,0x11,0x22,0x33,0x2F,0x11,0x80]
+
+
+class LegacyMessage(object):
+    """ A message with per-instance command tables, like the old parser """
+    def __init__(self, data):
+        self._data = list(data)
+        self.source = None
+        self._InsteonCommands = {
+            0x11:{'State':'On', 'Default':100, 'Fcn':lambda x: int(round(x/2.55))},
+            0x12:{'State':'On', 'Default':100, 'Fcn':lambda x: int(round(x/2.55))},
+            0x13:{'State':'Off','Default':0},
+            0x14:{'State':'Off','Default':0},
+            0x2E:{'State':'On', 'Default':100, 'Fcn':lambda x: int((x >> 4)/15.*100)},
+            0x2F:{'State':'Off','Default':0}}
+        self._InsteonCommandTypes = dict(
+            (i, {'Name':t.name, 'Length':t.length, 'Callback':self.make_event})
+            for i, t in enumerate(message._InsteonCommandTypes) if t is not None)
+
+    def make_event(self):
+        self.sender = self._data[2:5]
+        self.type = 'Direct'
+        self.ack = True
+        command = self._InsteonCommands[self._data[9]]
+        self.state = (command['State'], command['Fcn'](self._data[10]))
+        return copy.deepcopy(self)
+
+
+def legacy_event():
+    return LegacyMessage(FRAME).make_event()
+
+
+class StubHouse(object):
+    """ Just the event queue that Message.process() puts events on """
+    def __init__(self):
+        self.event_queue = Queue.Queue()
+
+
+_house = StubHouse()
+
+
+def new_event():
+    Insteon.Message(FRAME).process(_house)
+    return _house.event_queue.get(False)
+
+
+def rss():
+    """ Resident memory of this process in bytes """
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1]) * 1024
+    return 0
+
+
+def paced(make, rate, seconds):
+    """
+    Produce events at rate per second through a queue, consuming them like
+    House.process_events. Returns the CPU fraction and the CPU time spent
+    per event.
+    """
+    queue = Queue.Queue()
+    count = int(rate * seconds)
+    start = time.time()
+    cpu_start = sum(os.times()[:2])
+    for i in xrange(count):
+        queue.put(make())
+        while not queue.empty():
+            event = queue.get(False)
+            event.sender, event.type, event.state
+        delay = start + (i + 1.) / rate - time.time()
+        if delay > 0:
+            time.sleep(delay)
+    cpu = sum(os.times()[:2]) - cpu_start
+    return cpu / (time.time() - start), cpu / count
+
+
+def held(make, count):
+    """ Memory held by count queued events, in bytes per event """
+    queue = Queue.Queue()
+    before = rss()
+    for i in xrange(count):
+        queue.put(make())
+    return float(rss() - before) / count
+
+
+def per_event(make, count):
+    """ Wall time to create one event, unpaced """
+    start = time.time()
+    for i in xrange(count):
+        make()
+    return (time.time() - start) / count
+
+
+if __name__ == '__main__':
+    rate = float(sys.argv[1]) if len(sys.argv) > 1 else 1000.
+    seconds = float(sys.argv[2]) if len(sys.argv) > 2 else 5.
+
+    print "%d events/s for %.0f s" % (rate, seconds)
+    print "%-10s %8s %14s %14s %14s" % ('Event', 'CPU %', 'CPU us/event',
+                                        'Make us/event', 'Bytes/event')
+    kinds = [('deepcopy', legacy_event), ('Event', new_event)]
+    
+    # Measure memory smallest first, so freed memory is not reused
+    memory = dict((name, held(make, 20000)) for name, make in reversed(kinds))
+    for name, make in kinds:
+        cpu_frac, cpu_each = paced(make, rate, seconds)
+        print "%-10s %8.2f %14.1f %14.1f %14.0f" % (name, 100. * cpu_frac,
+            1e6 * cpu_each, 1e6 * per_event(make, 5000), memory[name])
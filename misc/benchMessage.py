@@ -0,0 +1,103 @@
+# Microbenchmark for Insteon Message allocation and parsing.
+#
+# Times creating messages, building outgoing messages (from a byte list, and
+# from a device Encoder's frame cache) ready to write, and parsing received
+# 0x50 messages through Message.process() onto an event queue, and measures
+# the memory each queued event takes. The print output of process() is
+# discarded. Run it on two versions of pyHome to compare them.
+#
+# Run it from the top-level pyHome folder (Linux only, for the memory use):
+#   python misc/benchMessage.py [number of messages]
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from pyHome import Insteon
+
+
+class NullHouse(object):
+    """ Just enough of a House to collect events """
+    def __init__(self):
+        self.events = []
+        self.event_queue = self
+    def put(self, event):
+        self.events.append(event)
+
+
+class NullOutput(object):
+    def write(self, text):
+        pass
+
+
+def rss():
+    """ Resident memory of this process in bytes """
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1]) * 1024
+    return 0
+
+
+def timeit(name, fcn, count):
+    start = time.time()
+    fcn(count)
+    elapsed = time.time() - start
+    print "%-28s %8.2f us/msg" % (name, 1e6 * elapsed / count)
+
+
+def create(count):
+    for i in xrange(count):
+        Insteon.Message()
+
+
+def build(count):
+    for i in xrange(count):
+        Insteon.Message([0x02,0x62,0x12,0x34,0x56,0x0F,0x11,i & 0xFF]) \
+            .get_byte_string()
+
+
+def encode(count):
+    encoder = Insteon.Encoder([0x12,0x34,0x56])
+    for i in xrange(count):
+        encoder.message(0x11, i & 0xFF).get_byte_string()
+
+
+FRAME = [0x02,0x50,0x12,0x34,0x56,0x11,0x22,0x33,0x2F,0x11,0x80]
+
+def parse(count, house=None):
+    house = house or NullHouse()
+    parser = Insteon.Message()
+    for i in xrange(count):
+        parser.clear()
+        parser.extend(FRAME)
+        parser.process(house)
+    return house
+
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    stdout = sys.stdout
+
+    timeit("Message()", create, count)
+    timeit("Message(outgoing bytes)", build, count)
+    timeit("Encoder.message()", encode, count)
+
+    sys.stdout = NullOutput()
+    start = time.time()
+    parse(count)
+    elapsed = time.time() - start
+    sys.stdout = stdout
+    print "%-28s %8.2f us/msg" % ("parse 0x50 to event queue",
+                                  1e6 * elapsed / count)
+
+    # Memory held by queued events
+    house = NullHouse()
+    before = rss()
+    sys.stdout = NullOutput()
+    parse(count, house)
+    sys.stdout = stdout
+    print "%-28s %8.0f bytes/event" % ("queued event memory",
+                                       float(rss() - before) / count)
@@ -0,0 +1,113 @@
+# Benchmark for the PLM receive path.
+#
+# This feeds a burst of synthetic Insteon traffic through a fake serial port
+# and compares the old byte-at-a-time read loop (Message.add_byte and
+# is_complete) with the bulk read into the PLM's streaming decoder. Message
+# processing is disabled so only reading and framing are timed. Set a noise
+# fraction to put runs of garbage bytes between that fraction of the messages,
+# like a noisy line.
+#
+# Run it from the top-level pyHome folder:
+#   python misc/benchPLM.py [number of messages] [bytes per read] [noise]
+
+import os
+import sys
+import time
+import random
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from pyHome import Insteon
+
+
+class FakePort(object):
+    """ Hands out a byte string in chunks like a busy serial port """
+    def __init__(self, data, chunk):
+        self.data = data
+        self.pos = 0
+        self.chunk = chunk
+
+    def inWaiting(self):
+        return min(self.chunk, len(self.data) - self.pos)
+
+    def read(self, size=1):
+        out = self.data[self.pos:self.pos+size]
+        self.pos += len(out)
+        return out
+
+    def write(self, data):
+        pass
+
+
+def make_traffic(count, noise=0.):
+    """ Build a mix of standard, extended, echo and NAK messages """
+    random.seed(0)
+    frames = []
+    for i in range(count):
+        if random.random() < noise:
+            frames.append([random.choice([0x00,0x7F,0xFF,0x02])
+                           for _ in range(random.randrange(1, 100))])
+        addr = [random.randrange(256) for _ in range(3)]
+        kind = random.random()
+        if kind < 0.6:
+            frames.append([0x02,0x50]+addr+[0x12,0x34,0x56,0x2F,0x11,0xFF])
+        elif kind < 0.8:
+            frames.append([0x02,0x62]+addr+[0x0F,0x11,0xFF,0x06])
+        elif kind < 0.9:
+            frames.append([0x02,0x51]+addr+[0x12,0x34,0x56,0x1F,0x2E,0x00]
+                          + [0]*14)
+        else:
+            frames.append([0x15])
+    return "".join(chr(b) for f in frames for b in f)
+
+
+class QuietMessage(Insteon.Message):
+    """ A message that skips processing """
+    __slots__ = ()
+    def process(self, house):
+        pass
+
+
+def old_loop(port, message):
+    """ The original PLM.run read loop """
+    while port.inWaiting() > 0:
+        data = port.read()
+        message.add_byte(ord(data))
+        if message.is_complete():
+            message.process(None)
+            message.clear()
+
+
+def new_loop(port, plm):
+    """ The bulk read into the decoder """
+    while port.inWaiting() > 0:
+        plm._read_port()
+
+
+def run(name, fcn, data):
+    start = time.time()
+    fcn()
+    elapsed = time.time() - start
+    print "%-22s %8.3f s  %12.0f bytes/s" % (name, elapsed, len(data)/elapsed)
+    return elapsed
+
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    chunk = int(sys.argv[2]) if len(sys.argv) > 2 else 64
+    noise = float(sys.argv[3]) if len(sys.argv) > 3 else 0.
+    data = make_traffic(count, noise)
+    print "%d messages, %d bytes, %d bytes per read" % (count, len(data), chunk)
+
+    message = QuietMessage()
+    port = FakePort(data, chunk)
+    before = run("byte-at-a-time", lambda: old_loop(port, message), data)
+
+    plm = Insteon.PLM(None, None)
+    plm._message = QuietMessage()
+    plm._serialport = FakePort(data, chunk)
+    after = run("bulk + decoder", lambda: new_loop(plm._serialport, plm),
+                data)
+
+    print "Speedup: %.1fx" % (before / after)
+    print "Line:", plm.get_line_stats()
@@ -0,0 +1,80 @@
+# Compare the PLM I/O modes ('poll' and 'select') on a pseudo-terminal.
+#
+# For each mode this starts a PLM thread on one end of a pty, leaves it idle
+# for a while, then measures how long a queued message takes to reach the
+# port and how long a received message takes to be processed. The other end
+# of the pty ACKs each command like a real PLM. Idle CPU and thread wakeups
+# are taken from PLM.get_io_stats().
+#
+# Run it from the top-level pyHome folder (Linux only):
+#   python misc/benchPLMIdle.py [idle seconds]
+
+import os
+import sys
+import time
+import tty
+import select
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from pyHome import Insteon
+
+
+def measure(mode, idle_time, samples=50):
+    master, slave = os.openpty()
+    tty.setraw(slave)
+    plm = Insteon.PLM(None, os.ttyname(slave), io_mode=mode)
+
+    received = []
+    class RecordedMessage(Insteon.Message):
+        __slots__ = ()
+        def process(self, house):
+            received.append(time.time())
+    plm._message = RecordedMessage()
+    plm.start()
+
+    # Idle period
+    time.sleep(idle_time)
+    idle = plm.get_io_stats()
+
+    # Send latency: queue a message and wait for it at the other end
+    send_lat = []
+    msg = Insteon.Message([0x02,0x62,0x12,0x12,0x12,0x0F,0x11,0xFF])
+    for i in range(samples):
+        start = time.time()
+        plm.send(msg)
+        select.select([master], [], [])
+        send_lat.append(time.time() - start)
+        os.write(master, os.read(master, 64) + chr(0x06))
+        time.sleep(0.01)
+
+    # Receive latency: write a message to the port and wait for processing
+    recv_lat = []
+    frame = "".join(chr(b) for b in
+                    [0x02,0x50,0x12,0x12,0x12,0x00,0x00,0x01,0x2F,0x11,0xFF])
+    for i in range(samples):
+        del received[:]
+        start = time.time()
+        os.write(master, frame)
+        while not received:
+            time.sleep(0.0001)
+        recv_lat.append(received[0] - start)
+        time.sleep(0.01)
+
+    plm.stop()
+    plm.join(1.)
+    os.close(master)
+    return idle, send_lat, recv_lat
+
+
+if __name__ == '__main__':
+    idle_time = float(sys.argv[1]) if len(sys.argv) > 1 else 5.
+
+    print "%-7s %10s %10s %12s %12s" % ('Mode', 'Wakeups/s', 'Idle CPU %',
+                                        'Send (ms)', 'Receive (ms)')
+    for mode in Insteon.PLM.io_modes:
+        idle, send_lat, recv_lat = measure(mode, idle_time)
+        print "%-7s %10.1f %10.2f %12.3f %12.3f" % (mode,
+            idle['Wakeups/s'], idle['CPU %'],
+            1000. * sum(send_lat) / len(send_lat),
+            1000. * sum(recv_lat) / len(recv_lat))
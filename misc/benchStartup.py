@@ -0,0 +1,63 @@
+# Compare the startup time and memory of pyHome with and without the GUI.
+#
+# For each mode this runs fresh Python processes that import pyHome and
+# create the House (with no PLM port), and reports the time taken, the 
+# resident memory, and whether wx was imported. The GUI window is not 
+# opened, so no display is needed. Its own memory and 100 ms update timer
+# come on top of the GUI numbers.
+#
+# Run it from the top-level pyHome folder (Linux only, for the memory use):
+#   python misc/benchStartup.py [runs]
+
+import os
+import sys
+import json
+import time
+import subprocess
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+
+def rss():
+    """ Resident memory of this process in bytes """
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1]) * 1024
+    return 0
+
+
+def child(headless):
+    """ Start the house and print the measurements as JSON """
+    before = rss()
+    start = time.time()
+    import pyHome
+    house = pyHome.House(usbport=None, headless=headless)
+    elapsed = time.time() - start
+    print json.dumps({'Time': elapsed, 'RSS': rss(), 'Added': rss() - before,
+                      'wx': 'wx' in sys.modules})
+
+
+def measure(headless, runs):
+    results = []
+    for i in range(runs):
+        output = subprocess.check_output([sys.executable, __file__, '--child',
+                                          'headless' if headless else 'gui'])
+        results.append(json.loads(output.splitlines()[-1]))
+    results.sort(key=lambda r: r['Time'])
+    return results[len(results) // 2]
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 2 and sys.argv[1] == '--child':
+        child(sys.argv[2] == 'headless')
+        sys.exit()
+        
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    print "Median of %d runs" % runs
+    print "%-10s %12s %10s %12s %5s" % ('Mode', 'Startup ms', 'RSS MB', 
+                                        'Added MB', 'wx')
+    for name, headless in (('GUI', False), ('Headless', True)):
+        r = measure(headless, runs)
+        print "%-10s %12.1f %10.1f %12.1f %5s" % (name, 1e3 * r['Time'],
+            r['RSS'] / 1e6, r['Added'] / 1e6, 'yes' if r['wx'] else 'no')
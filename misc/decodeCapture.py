@@ -0,0 +1,50 @@
+# Decode a whole PLM capture at once with the NumPy batch decoder.
+#
+# Prints the line statistics, the decoding rate, and the number of messages
+# from each device address. Use --raw for a file of raw received bytes
+# instead of a pyHome capture file. Requires NumPy.
+#
+# Run it from the top-level pyHome folder:
+#   python misc/decodeCapture.py capture.cap [--raw] [--top N]
+
+import os
+import sys
+import mmap
+import time
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import numpy as np
+from pyHome.Insteon import batch
+from pyHome.Insteon.event import format_address
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Batch decode a capture")
+    parser.add_argument('path', help="capture file")
+    parser.add_argument('--raw', action='store_true',
+                        help="the file holds raw received bytes")
+    parser.add_argument('--top', type=int, default=10,
+                        help="number of addresses to list (default 10)")
+    args = parser.parse_args()
+
+    start = time.time()
+    if args.raw:
+        with open(args.path, 'rb') as f:
+            buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            records, stats = batch.decode(buf)
+    else:
+        times, records, stats = batch.decode_capture(args.path)
+    elapsed = time.time() - start
+
+    for key in sorted(stats):
+        print "%-16s %d" % (key, stats[key])
+    print "%-16s %.3f s (%.0f messages/s)" % ('Decode time', elapsed,
+        (stats['Frames'] + stats['NAKs']) / max(elapsed, 1e-9))
+
+    received = records[records['type'] != 0x62]
+    addresses, counts = np.unique(received['address'], return_counts=True)
+    print "\nMessages received by address:"
+    for i in np.argsort(counts)[::-1][:args.top]:
+        print "  %s %8d" % (format_address(int(addresses[i])), counts[i])
@@ -0,0 +1,36 @@
+# Replay a PLM traffic capture through the Insteon parser and House events.
+#
+# Record a capture by calling house.PLM.start_capture('traffic.cap') on a
+# running house, then replay it here, as fast as possible by default or
+# with its original timing with --realtime.
+#
+# Run it from the top-level pyHome folder:
+#   python misc/replayCapture.py traffic.cap [--realtime] [--speed X]
+
+import os
+import sys
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import pyHome
+from pyHome.core import capture
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Replay a PLM capture")
+    parser.add_argument('capture', help="capture file to replay")
+    parser.add_argument('--realtime', action='store_true',
+                        help="keep the original timing")
+    parser.add_argument('--speed', type=float, default=1.,
+                        help="realtime speed multiplier (default 1)")
+    args = parser.parse_args()
+
+    # The PLM is never started, so no serial port is opened
+    house = pyHome.House(usbport=None, headless=True)
+    house.running = True
+    result = capture.replay(house, args.capture, args.realtime, args.speed)
+
+    print "Replayed %d bytes and %d events in %.3f s (%.0f events/s)" % (
+        result['Bytes'], result['Events'], result['Elapsed'],
+        result['Events'] / result['Elapsed'] if result['Elapsed'] else 0.)
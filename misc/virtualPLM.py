@@ -0,0 +1,56 @@
+# Run a simulated Insteon PLM on a pseudo-terminal (Linux only).
+#
+# The simulated devices are read from UserData/devices.xml. Point pyHome at
+# the printed port instead of /dev/ttyUSB0, or pass --house to run the House
+# against the simulator in this process, headless, logging to the console.
+#
+# Run it from the top-level pyHome folder:
+#   python misc/virtualPLM.py [--rate EVENTS_PER_SEC] [--nak-rate FRACTION]
+#                             [--house]
+
+import os
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from pyHome.Insteon import virtualplm
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Simulated Insteon PLM")
+    parser.add_argument('--devices', default=os.path.join('UserData',
+                        'devices.xml'), help="devices.xml to simulate")
+    parser.add_argument('--rate', type=float, default=1.,
+                        help="device events per second (default 1)")
+    parser.add_argument('--nak-rate', type=float, default=0.,
+                        help="fraction of commands to NAK (default 0)")
+    parser.add_argument('--ack-delay', type=float, default=0.05,
+                        help="seconds before a device ACKs (default 0.05)")
+    parser.add_argument('--house', action='store_true',
+                        help="run the pyHome House on the simulator")
+    args = parser.parse_args()
+
+    sim = virtualplm.VirtualPLM(virtualplm.load_devices(args.devices),
+                                rate=args.rate, nak_rate=args.nak_rate,
+                                ack_delay=args.ack_delay)
+    sim.start()
+    print "Virtual PLM running on", sim.port
+
+    if args.house:
+        import pyHome
+        from pyHome.core import log
+        log.configure()
+        house = pyHome.House(usbport=sim.port, io_mode='select',
+                             headless=True)
+        # Keep the simulator's port out of the real devices.xml
+        house.save_devices = lambda: None
+        house.activate()
+    else:
+        try:
+            while True:
+                time.sleep(5.)
+                print sim.get_stats()
+        except KeyboardInterrupt:
+            sim.stop()
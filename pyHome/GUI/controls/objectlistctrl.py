@@ -42,13 +42,16 @@ class ObjectListCtrl(wx.ListCtrl):
         self.Bind(wx.EVT_LIST_DELETE_ALL_ITEMS, self._delete_all_items)
         
 
-    def update_objects(self, objects):
+    def update_objects(self, objects, changed=None):
         """
         In this case, 'objects' is a list of objects. Each object must
         have a unique attribute 'tag', and must provide strings for all columns
         
         If a device state is changed, this looks it up in the ListCtrl and changes
         its properties, without having to erase the entire ListCtrl
+        
+        If changed is a set of tags, only the rows of those objects are 
+        updated (unless objects were added or removed).
         """
         # Deal with deleted objects still in the ListCtrl
         objkeys = [obj.tag for obj in objects]
@@ -61,6 +64,10 @@ class ObjectListCtrl(wx.ListCtrl):
         sortedObjects = sorted(objects, key=lambda k: k.sorting_name())
         
         for obj in sortedObjects:
+            if changed is not None and obj.tag not in changed \
+                    and obj.tag in self._map:
+                continue
+                
             # If the object already exists, just update its value
             if obj.tag in self._map:
                 self._map[obj.tag] = obj
@@ -30,6 +30,9 @@ import time
 import threading
 import Queue
 import panels
+from pyHome.core.log import get_logger
+
+_log = get_logger('gui')
 
 class MainFrame(wx.Frame):
     """
@@ -42,8 +45,18 @@ class MainFrame(wx.Frame):
         self.house = parent.house
         self.log_queue = self.parent.log_queue
         
-        #store devices list, devices dict, or call on demand??
-        self.devices = self.house.get_devices()
+        #Devices from the house snapshot, replaced when its generation changes
+        self.generation = self.house.snapshot.generation
+        self.devices = self.house.snapshot.devices
+        
+        #Tags of devices that changed state since the last panel update. The
+        #current panel is only fully updated every full_update_ticks updates,
+        #to refresh things like sensor countdowns.
+        self._changed = set()
+        self._changed_lock = threading.Lock()
+        self._ticks = 0
+        self.full_update_ticks = 10
+        self._subscription = self.house.bus.subscribe(self._state_changed)
 
         #Create Menu bar and menus
         #self.topMenu = wx.MenuBar()
@@ -72,15 +85,38 @@ class MainFrame(wx.Frame):
         
         
     def _quit_program(self, event):
+        self._subscription.cancel()
         self.house.event_queue.put('Kill')
         self.Destroy()
         
+    def _state_changed(self, changes):
+        """ Called by the house state bus, in the house thread """
+        self._changed_lock.acquire()
+        try:
+            self._changed.update(c.device.tag for c in changes)
+        finally:
+            self._changed_lock.release()
+        
     def _update_current_panel(self, event):
         self.update()
-        self.Notebook.GetCurrentPage().update()
+        
+        self._changed_lock.acquire()
+        try:
+            changed, self._changed = self._changed, set()
+        finally:
+            self._changed_lock.release()
+            
+        self._ticks += 1
+        if self._ticks % self.full_update_ticks == 0:
+            self.Notebook.GetCurrentPage().update()
+        else:
+            self.Notebook.GetCurrentPage().update_changed(changed)
 
     def update(self):
-        self.devices = self.house.get_devices()
+        snapshot = self.house.snapshot
+        if snapshot.generation != self.generation:
+            self.generation = snapshot.generation
+            self.devices = snapshot.devices
 
 
 class HouseNotebook(fnb.FlatNotebook): #wx.Notebook):
@@ -137,6 +173,7 @@ class Thread(threading.Thread):
         app.MainLoop()
 
     def log_event(self, msg):
+        _log.info(msg)
         timestr = time.strftime("%Y-%m-%d %H:%M:%S")
         text = """[%s] %s""" % (timestr, msg)
         self.log_queue.put(text)
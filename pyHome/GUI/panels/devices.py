@@ -43,6 +43,7 @@ class Devices(GridPanel):
         self.roomSelect = wx.ComboBox(self, wx.ID_ANY, style=wx.CB_READONLY, 
                                       choices=self.house.get_rooms())
         self.roomSelect.SetSelection(0)
+        self._generation = self.house.snapshot.generation
         self._addRow([roomLabel, self.roomSelect], 1)
         
         cols = [('Device Name',200),('Room',200),('Address',150),('State',150)]
@@ -154,12 +155,26 @@ class Devices(GridPanel):
         self.devices = self.parent.parent.devices
         
         room = self.roomSelect.GetValue()
-        self.rooms = self.house.get_rooms()
-        idx = self.rooms.index(room)
         
-        self.roomSelect.Clear()
-        self.roomSelect.AppendItems(self.rooms)
-        self.roomSelect.SetSelection(idx)
+        # Only refill the room list when the house devices change
+        generation = self.house.snapshot.generation
+        if generation != self._generation:
+            self._generation = generation
+            self.rooms = self.house.get_rooms()
+            idx = self.rooms.index(room) if room in self.rooms else 0
+            
+            self.roomSelect.Clear()
+            self.roomSelect.AppendItems(self.rooms)
+            self.roomSelect.SetSelection(idx)
             
         self.device_list.update_objects( self.house.get_devices(room) )
+        
+    #----------------------------------------------------------------------
+    def update_changed(self, changed):
+        if self.house.snapshot.generation != self._generation:
+            self.update()
+        elif changed:
+            room = self.roomSelect.GetValue()
+            self.device_list.update_objects( self.house.get_devices(room),
+                                             changed )
 
@@ -41,6 +41,7 @@ class FloorPlan(GridPanel):
         self.devices = self.parent.parent.devices
         
         self._map = {}
+        self._generation = None
         
         #Set the panel sizer
         self.SetSizer(self.vBox)
@@ -118,16 +119,19 @@ class FloorPlan(GridPanel):
 
     #----------------------------------------------------------------------
     def update(self):
-        self.devices = self.house.get_devices()
+        snapshot = self.house.snapshot
+        self.devices = snapshot.devices
         
         row = 0
         col = 0
         
-        tags = [dev.tag for dev in self.devices]
-        for tag, devDict in self._map.items():
-            if tag not in tags:
-                self._map[tag]['Icon'].Hide()
-                del self._map[tag]
+        # Hide icons of removed devices when the house devices change
+        if snapshot.generation != self._generation:
+            self._generation = snapshot.generation
+            for tag, devDict in self._map.items():
+                if tag not in snapshot.tags:
+                    self._map[tag]['Icon'].Hide()
+                    del self._map[tag]
         
         all_devs_locked = True
         for tag, devDict in self._map.items():
@@ -151,6 +155,17 @@ class FloorPlan(GridPanel):
             
             self._map[dev.tag]['Icon'].update( dev )
             
+    #----------------------------------------------------------------------
+    def update_changed(self, changed):
+        snapshot = self.house.snapshot
+        if snapshot.generation != self._generation:
+            self.update()
+            return
+            
+        for tag in changed:
+            if tag in self._map and tag in snapshot.tags:
+                self._map[tag]['Icon'].update( snapshot.tags[tag] )
+            
     #----------------------------------------------------------------------
     def _show_info(self, dev):
         """ 
@@ -55,3 +55,11 @@ class GridPanel(wx.Panel):
     #----------------------------------------------------------------------
     def update(self):
         pass
+        
+    #----------------------------------------------------------------------
+    def update_changed(self, changed):
+        """
+        Refresh only what shows the devices whose tags are in the set
+        changed. Panels that do not track devices do a full update.
+        """
+        self.update()
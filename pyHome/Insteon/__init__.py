@@ -26,6 +26,11 @@ SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 from dimmer import Dimmer
 from switch import Switch
 from plm import PLM
+from scheduler import CommandScheduler
+from decoder import Decoder
+from virtualplm import VirtualPLM
 from message import Message
+from encoder import Encoder
+from event import Event
 from motionsensor import MotionSensor
 from opensensor import OpenSensor
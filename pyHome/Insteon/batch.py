@@ -0,0 +1,230 @@
+"""
+Copyright (c) 2012, Tyler Voskuilen
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met: 
+
+1. Redistributions of source code must retain the above copyright notice, this
+   list of conditions and the following disclaimer. 
+2. Redistributions in binary form must reproduce the above copyright notice,
+   this list of conditions and the following disclaimer in the documentation
+   and/or other materials provided with the distribution. 
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR
+ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+(INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+(INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+
+# NumPy is only needed for batch decoding, so it is optional
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from message import _InsteonCommands
+from decoder import (_LENGTHS, _ECHO, _ECHO_FLAGS, _EXTENDED, 
+                     _EXTENDED_LENGTH)
+from pyHome.core.capture import CaptureReader, RX
+
+
+#: Fields of the decoded message records. address is the sender of 0x50 and
+#: 0x51 messages and the target of 0x62 messages. level is the decoded
+#: light level, or -1 if cmd1 is not an on/off command.
+FIELDS = [('offset', '<i8'), ('type', 'u1'), ('address', '<u4'),
+          ('flags', 'u1'), ('cmd1', 'u1'), ('cmd2', 'u1'), ('level', '<i2')]
+
+_DECODED_TYPES = (0x50, 0x51, 0x62)
+_tables = None
+
+
+def _require_numpy():
+    if np is None:
+        raise ImportError("NumPy is required for batch decoding")
+        
+        
+def _get_tables():
+    """
+    Build the lookup tables once: message lengths by type byte from the
+    streaming decoder's table, and levels from the Message command tables
+    by (cmd1, cmd2) for direct ACKs and otherwise by cmd1 alone
+    """
+    global _tables
+    if _tables is None:
+        lengths = np.array(_LENGTHS, np.int64)
+        
+        levels = np.full((256, 256), -1, np.int16)
+        defaults = np.full(256, -1, np.int16)
+        for cmd1, command in enumerate(_InsteonCommands):
+            if command is None:
+                continue
+            defaults[cmd1] = command.default
+            if command.level is None:
+                levels[cmd1, :] = command.default
+            else:
+                levels[cmd1, :] = [command.level(x) for x in range(256)]
+                
+        _tables = (lengths, levels, defaults)
+    return _tables
+    
+    
+def decode(buf):
+    """
+    Decode every complete message in buf, any buffer of received bytes (a
+    string, bytearray, mmap or uint8 array). Messages are split the same way
+    as the streaming :class:`Decoder` does, but with array operations over
+    the whole buffer instead of Python calls per message, for offline
+    analysis of long captures.
+    
+    Returns (records, stats). records is a structured array with
+    :data:`FIELDS` for each 0x50, 0x51 and 0x62 message in order. stats has
+    the same counters as :meth:`Decoder.get_stats`, plus 'Remainder', the
+    number of bytes after the last complete message.
+    
+    Levels of received messages are decoded like
+    :meth:`Message._process_insteon_std_recv`, from cmd2 only for direct
+    ACKs. Levels of 0x62 commands are always decoded from cmd2.
+    """
+    _require_numpy()
+    lengths, levels, defaults = _get_tables()
+    data = np.frombuffer(buf, np.uint8)
+    n = len(data)
+    
+    # Candidate message starts: NAKs, and 0x02 followed by a known type
+    stx = np.flatnonzero(data[:-1] == 0x02)
+    stx = stx[lengths[data[stx + 1]] > 0]
+    naks = np.flatnonzero(data == 0x15)
+    starts = np.union1d(stx, naks)
+    
+    # Length of the message at each candidate, and whether it is complete
+    size = np.ones(len(starts), np.int64)
+    is_stx = data[starts] == 0x02
+    types = np.where(is_stx, data[np.minimum(starts + 1, n - 1)], 0)
+    size[is_stx] = lengths[types[is_stx]]
+    echo = is_stx & (types == _ECHO)
+    extended = echo & (starts + _ECHO_FLAGS < n)
+    extended[extended] = data[starts[extended] + _ECHO_FLAGS] & _EXTENDED != 0
+    size[extended] = _EXTENDED_LENGTH
+    complete = (starts + size <= n) & ~(echo & (starts + _ECHO_FLAGS >= n))
+    
+    # After a message the decoder resyncs to the next candidate start at or
+    # past its end. Incomplete messages have no successor.
+    succ = np.searchsorted(starts, starts + size)
+    succ[~complete] = len(starts)
+    
+    # Keep only the chain of messages reached from the first candidate.
+    # Messages inside other messages are pruned a step at a time, until
+    # each remaining one has a remaining predecessor. Runs of false starts
+    # rejoin the real messages within a few steps, so this is quick.
+    alive = np.ones(len(starts), bool)
+    while True:
+        reached = np.zeros(len(starts) + 1, bool)
+        reached[succ[alive]] = True
+        reached[0] = True
+        now_alive = alive & reached[:-1]
+        if (now_alive == alive).all():
+            break
+        alive = now_alive
+        
+    chain = alive & complete
+    first, last = starts[chain], starts[chain] + size[chain]
+    gaps = first - np.concatenate(([0], last[:-1]))
+    chain_naks = chain & ~is_stx
+    stats = {'Frames': int(chain.sum() - chain_naks.sum()),
+             'NAKs': int(chain_naks.sum()),
+             'Discarded bytes': int(gaps.sum()),
+             'Resyncs': int((gaps > 0).sum()),
+             'Remainder': int(n - (last[-1] if len(last) else 0))}
+    
+    # Gather the fields of the message types of interest
+    keep = chain & np.in1d(types, _DECODED_TYPES)
+    pos = starts[keep]
+    is_echo = types[keep] == _ECHO
+    field = np.where(is_echo, 5, 8) + pos
+    
+    records = np.zeros(len(pos), FIELDS)
+    records['offset'] = pos
+    records['type'] = types[keep]
+    records['address'] = ((data[pos + 2].astype(np.uint32) << 16) |
+                          (data[pos + 3].astype(np.uint32) << 8) | 
+                          data[pos + 4])
+    records['flags'] = data[field]
+    records['cmd1'] = cmd1 = data[field + 1]
+    records['cmd2'] = cmd2 = data[field + 2]
+    
+    direct_ack = is_echo | (records['flags'] & 1<<5 != 0)
+    records['level'] = np.where(direct_ack, levels[cmd1, cmd2], 
+                                defaults[cmd1])
+    return records, stats
+    
+    
+def decode_capture(path, direction=RX, window=1<<24):
+    """
+    Decode the received bytes (or sent, with direction=TX) of a capture file
+    written by :class:`pyHome.core.capture.CaptureWriter`. Returns (times,
+    records, stats) like :func:`decode`, where times holds the timestamp
+    of the read that finished each message.
+    
+    The bytes are decoded in windows of about window bytes, and the partial
+    message at the end of each window is carried into the next one, so
+    memory use does not grow with the size of the capture beyond the
+    decoded records.
+    """
+    _require_numpy()
+    lengths = _get_tables()[0]
+    times, records = [], []
+    stats = dict.fromkeys(('Frames', 'NAKs', 'Discarded bytes', 'Resyncs'), 0)
+    buf = bytearray()
+    base = 0        # Offset of the start of buf in the decoded stream
+    ends = []       # Offset in buf of the end of each read, and its time
+    stamps = []
+    
+    reader = CaptureReader(path)
+    try:
+        for timestamp, rec_dir, data in reader:
+            if rec_dir != direction:
+                continue
+            buf.extend(data)
+            ends.append(len(buf))
+            stamps.append(timestamp)
+            if len(buf) >= window:
+                buf, base = _decode_window(buf, base, ends, stamps, lengths,
+                                           times, records, stats)
+                ends, stamps = [], []
+    finally:
+        reader.close()
+        
+    _decode_window(buf, base, ends, stamps, lengths, times, records, stats)
+    return np.concatenate(times), np.concatenate(records), stats
+    
+    
+def _decode_window(buf, base, ends, stamps, lengths, times, records, stats):
+    """
+    Decode one window of decode_capture(), adding its message times and
+    records to the lists and its counters to stats. Returns the undecoded
+    bytes at the end of the window and their offset in the stream.
+    """
+    window, counts = decode(buf)
+    for key in ('Frames', 'NAKs', 'Discarded bytes', 'Resyncs'):
+        stats[key] += counts[key]
+    stats['Remainder'] = counts['Remainder']
+    
+    # Map each message's last byte to the read it finished in
+    size = lengths[window['type']]
+    extended = (window['type'] == _ECHO) & (window['flags'] & _EXTENDED != 0)
+    size[extended] = _EXTENDED_LENGTH
+    read = np.searchsorted(ends, window['offset'] + size - 1, 'right')
+    times.append(np.asarray(stamps, np.float64)[read])
+    
+    window['offset'] += base
+    records.append(window)
+    
+    done = len(buf) - counts['Remainder']
+    return buf[done:], base + done
@@ -0,0 +1,161 @@
+"""
+Copyright (c) 2012, Tyler Voskuilen
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met: 
+
+1. Redistributions of source code must retain the above copyright notice, this
+   list of conditions and the following disclaimer. 
+2. Redistributions in binary form must reproduce the above copyright notice,
+   this list of conditions and the following disclaimer in the documentation
+   and/or other materials provided with the distribution. 
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR
+ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+(INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+(INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+
+from pyHome.core.ringbuffer import RingBuffer
+from message import _InsteonCommandTypes
+
+
+#: Message lengths by type byte, 0 for bytes that are not a message type
+_LENGTHS = [t.length if t is not None else 0 for t in _InsteonCommandTypes]
+
+#: 0x62 echoes are standard or extended length, set by this bit of the flags
+#: byte at this offset
+_ECHO = 0x62
+_ECHO_FLAGS = 5
+_EXTENDED = 1<<4
+_EXTENDED_LENGTH = 23
+
+
+def frame_length(buf):
+    """
+    Get the length of the message at the front of buf, a sequence of received
+    bytes. Returns 0 if the first bytes cannot start a message, or None if
+    more bytes are needed to tell.
+    """
+    if len(buf) == 0:
+        return None
+        
+    if buf[0] == 0x15:                  # A lone NAK is a complete message
+        return 1
+        
+    if buf[0] != 0x02:
+        return 0
+        
+    if len(buf) < 2:
+        return None
+        
+    length = _LENGTHS[buf[1]]
+    if length and buf[1] == _ECHO:
+        if len(buf) <= _ECHO_FLAGS:
+            return None
+        if buf[_ECHO_FLAGS] & _EXTENDED:
+            return _EXTENDED_LENGTH
+            
+    return length
+
+
+class Decoder(object):
+    """
+    A streaming decoder that splits received PLM bytes into messages.
+    
+    Each chunk of bytes passed to :meth:`feed` is appended to a ring buffer,
+    and complete messages (including lone 0x15 NAKs) are taken from the front
+    of it as bytearrays. Bytes that cannot start a message are discarded up
+    to the next 0x02 or 0x15 with a single search, so the work done is
+    proportional to the number of bytes received even on a noisy line.
+    Partial messages are kept until the rest of their bytes arrive.
+    
+    The counters give the line quality:
+    
+    * frames: Complete messages decoded (not counting NAKs)
+    * naks: Lone NAKs decoded
+    * discarded: Bytes thrown away while resynchronizing
+    * resyncs: Number of times the decoder lost a message boundary (a run
+      of garbage counts once)
+    """
+    def __init__(self, capacity=1024):
+        self._buf = RingBuffer(capacity)
+        self.frames = 0
+        self.naks = 0
+        self.discarded = 0
+        self.resyncs = 0
+        self._synced = True
+        
+        
+    def __len__(self):
+        """ Number of buffered bytes not yet decoded """
+        return len(self._buf)
+        
+        
+    def feed(self, data):
+        """
+        Add a string of received bytes, and get an iterator over the complete
+        messages now in the buffer. Messages not iterated over are returned
+        by the next call.
+        """
+        self._buf.write(data)
+        return self._decode()
+        
+        
+    def get_stats(self):
+        """ Get the decoder counters """
+        return {'Frames': self.frames,
+                'NAKs': self.naks,
+                'Discarded bytes': self.discarded,
+                'Resyncs': self.resyncs}
+        
+        
+    def clear(self):
+        """ Discard any buffered bytes """
+        self._buf.clear()
+        
+        
+    def _decode(self):
+        buf = self._buf
+        while len(buf) > 0:
+            length = frame_length(buf)
+            
+            if length == 0:             # Skip to the next possible start
+                self._resync(1 if buf[0] == 0x02 else 0)
+                continue
+                
+            if length is None or len(buf) < length:
+                return
+                
+            if length == 1:             # Lone NAK
+                self.naks += 1
+            else:
+                self.frames += 1
+            self._synced = True
+            yield buf.read(length)
+            
+            
+    def _resync(self, start):
+        """
+        Discard bytes from the front of the buffer up to the next one, at or
+        after start, that can begin a message
+        """
+        buf = self._buf
+        stx = buf.find('\x02', start)
+        nak = buf.find('\x15', start)
+        if stx < 0 or (0 <= nak < stx):
+            stx = nak
+        count = stx if stx >= 0 else len(buf)
+        
+        buf.skip(count)
+        self.discarded += count
+        if self._synced:
+            self.resyncs += 1
+            self._synced = False
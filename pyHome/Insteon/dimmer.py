@@ -23,16 +23,14 @@ ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
 SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 """
 
-from message import Message
-
 import pyHome.core
 from switch import Switch
+from encoder import Encoder, rate_code
 
 class Dimmer(Switch, pyHome.core.Dimmer):
     def __init__(self, house, xml):
         pyHome.core.Dimmer.__init__(self, house, xml)
-        self._InsteonRates = [480., 360., 270., 210., 150., 90., 47., 38.5, 
-                              32., 28., 23.5, 19., 6.5, 2., 0.3, 0.1]
+        self._encoder = Encoder(self.address)
    
     def ramp_on(self, time=10., level=100):
         """ Ramp on in 'time' seconds (0.1-480) to level (0-100) """
@@ -44,12 +42,8 @@ class Dimmer(Switch, pyHome.core.Dimmer):
         level = min(max(0,level),100)
         time = min(max(0.1,time),480)
 
-        #Find nearest rate code
-        rate_code = min((n,i) for i, n in    \
-                       enumerate([abs(time-x) for x in self._InsteonRates]))[1]
-
-        cmd = (int(round(level / 100. * 15)) << 4) + rate_code
-        self.send( Message([0x02,0x62]+self.address+[0x0F,0x2E,cmd]) )
+        cmd = (int(round(level / 100. * 15)) << 4) + rate_code(time)
+        self.send( self._message(0x2E, cmd) )
 
       
     def ramp_off(self, time=10.):
@@ -57,9 +51,5 @@ class Dimmer(Switch, pyHome.core.Dimmer):
         #Coerce inputs
         time = min(max(0.1,time),480)
 
-        #Find nearest rate code
-        rate_code = min((n,i) for i, n in enumerate([abs(time-x) \
-                        for x in self._InsteonRates]))[1]
-
-        self.send( Message([0x02,0x62]+self.address+[0x0F,0x2F,rate_code]) )
+        self.send( self._message(0x2F, rate_code(time)) )
 
@@ -0,0 +1,75 @@
+"""
+Copyright (c) 2012, Tyler Voskuilen
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met: 
+
+1. Redistributions of source code must retain the above copyright notice, this
+   list of conditions and the following disclaimer. 
+2. Redistributions in binary form must reproduce the above copyright notice,
+   this list of conditions and the following disclaimer in the documentation
+   and/or other materials provided with the distribution. 
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR
+ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+(INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+(INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+
+from message import Message
+
+
+# Ramp times in seconds for each rate code
+# http://www.madreporite.com/insteon/ramprate.htm
+_InsteonRates = (480., 360., 270., 210., 150., 90., 47., 38.5, 
+                 32., 28., 23.5, 19., 6.5, 2., 0.3, 0.1)
+
+_rate_codes = {}
+
+
+def rate_code(time):
+    """ Get the rate code nearest to a ramp time (0.1-480 seconds) """
+    code = _rate_codes.get(time)
+    if code is None:
+        code = min((abs(time-x), i) for i, x in enumerate(_InsteonRates))[1]
+        if len(_rate_codes) > 1000:   # Only remember the times used most
+            _rate_codes.clear()
+        _rate_codes[time] = code
+    return code
+
+
+class Encoder(object):
+    """
+    Builds standard direct (0x62) messages to one device.
+    
+    The header bytes are computed once from the device address, and each
+    finished frame is kept by its (cmd1, cmd2) pair, so sending a command
+    again only wraps the cached byte string in a :class:`Message`.
+    There are at most 65536 pairs, and in practice only a few hundred.
+    """
+    def __init__(self, address):
+        self.address = list(address)
+        self.header = bytes(bytearray([0x02,0x62] + self.address + [0x0F]))
+        self._frames = {}
+        
+        
+    def frame(self, cmd1, cmd2):
+        """ Get the byte string of the message with these command bytes """
+        key = cmd1 << 8 | cmd2
+        frame = self._frames.get(key)
+        if frame is None:
+            frame = self.header + chr(cmd1) + chr(cmd2)
+            self._frames[key] = frame
+        return frame
+        
+        
+    def message(self, cmd1, cmd2):
+        """ Get a new message with these command bytes """
+        return Message(self.frame(cmd1, cmd2))
@@ -0,0 +1,73 @@
+"""
+Copyright (c) 2012, Tyler Voskuilen
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met: 
+
+1. Redistributions of source code must retain the above copyright notice, this
+   list of conditions and the following disclaimer. 
+2. Redistributions in binary form must reproduce the above copyright notice,
+   this list of conditions and the following disclaimer in the documentation
+   and/or other materials provided with the distribution. 
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR
+ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+(INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+(INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+
+import collections
+
+
+def address_to_int(address):
+    """ Convert a device address like [0x12,0x34,0x56] to 0x123456 """
+    return (address[0] << 16) | (address[1] << 8) | address[2]
+
+
+def int_to_address(value):
+    """ Convert an address like 0x123456 to a list [0x12,0x34,0x56] """
+    return [(value >> 16) & 0xFF, (value >> 8) & 0xFF, value & 0xFF]
+
+
+def format_address(value):
+    """ Format an address like 0x123456 as '12:34:56' """
+    return '%02X:%02X:%02X' % tuple(int_to_address(value))
+
+
+class Event(collections.namedtuple('Event', 'sender flags cmd1 cmd2 '
+                                            'state timestamp source')):
+    """
+    An immutable record of a message received from an Insteon device. These
+    are put on the House event queue by the PLM.
+    
+    :param sender: Sender address as an int (see :func:`address_to_int`)
+    :param flags: Message flag byte
+    :param cmd1: Command byte 1
+    :param cmd2: Command byte 2
+    :param state: Decoded (state, level) tuple
+    :param timestamp: time.time() when the message was received
+    :param source: Port of the PLM that received it
+    """
+    __slots__ = ()
+    
+    @property
+    def type(self):
+        """ 'Broadcast' or 'Direct', from bit 7 of the flags """
+        return 'Broadcast' if self.flags & 1<<7 else 'Direct'
+        
+    @property
+    def ack(self):
+        """ True if this is a direct ACK (bit 5 of the flags) """
+        return self.flags & 1<<5 == 1<<5
+        
+    def __str__(self):
+        return '%s from %s: %02X %02X %02X %s' % (self.type, 
+                format_address(self.sender), self.flags, self.cmd1, 
+                self.cmd2, self.state)
@@ -23,8 +23,78 @@ ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
 SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 """
 
-import copy
+import time
+import collections
 import pyHome.core
+from pyHome.core.log import get_logger
+from event import Event
+
+_log = get_logger('parser')
+
+
+# Motion sensor command info
+# http://www.fancygaphtrn.com/home-automation/insteon/13627
+
+# What can be in command byte 1, and how to process byte 2, if applicable
+# http://www.madreporite.com/insteon/commands.htm
+_Command = collections.namedtuple('_Command', 'state default level')
+
+def _byte_level(x):
+    return int(round(x/2.55))
+
+def _ramp_level(x):
+    return int((x >> 4)/15.*100)
+
+_COMMANDS = {0x11: _Command('On',  100, _byte_level),
+             0x12: _Command('On',  100, _byte_level),
+             0x13: _Command('Off', 0,   None),
+             0x14: _Command('Off', 0,   None),
+             0x2E: _Command('On',  100, _ramp_level),
+             0x2F: _Command('Off', 0,   None)}
+
+#: Command info indexed by command byte 1 (None for unsupported commands)
+_InsteonCommands = tuple(_COMMANDS.get(i) for i in range(256))
+
+
+# The 2nd byte of a message gives its type, length, and the name of the
+# Message method that processes it
+_CommandType = collections.namedtuple('_CommandType', 'name length callback')
+
+_COMMAND_TYPES = \
+    {0x50: _CommandType('Insteon Standard Received', 11, 
+                        '_process_insteon_std_recv'),
+     0x51: _CommandType('Insteon Extended Received', 25, '_ignore'),
+     0x52: _CommandType('X10 Received',              4,  '_ignore'),
+     0x53: _CommandType('All-Link Complete',         10, '_ignore'),
+     0x54: _CommandType('Button Event Report',       3,  '_ignore'),
+     0x55: _CommandType('User Reset Detected',       2,  '_ignore'),
+     0x56: _CommandType('All-Link Cleanup Failure',  7,  '_ignore'),
+     0x57: _CommandType('All-Link Record Response',  10, '_ignore'),
+     0x58: _CommandType('All-Link Cleanup Report',   3,  '_ignore'),
+     0x60: _CommandType('Get IM Info',               9,  '_ignore'),
+     0x61: _CommandType('Send All-Link Command',     6,  '_ignore'),
+     0x62: _CommandType('Send Insteon Message',      9, 
+                        '_process_insteon_cmd_echo'),
+     0x63: _CommandType('Send X10 Message',          5,  '_ignore'),
+     0x64: _CommandType('Start All-Linking',         5,  '_ignore'),
+     0x65: _CommandType('Cancel All-Linking',        3,  '_ignore'),
+     0x66: _CommandType('Set Host Device Category',  6,  '_ignore'),
+     0x67: _CommandType('Reset IM',                  3,  '_ignore'),
+     0x68: _CommandType('Set Insteon ACK Byte',      4,  '_ignore'),
+     0x69: _CommandType('Get First All-Link Record', 3,  '_ignore'),
+     0x6A: _CommandType('Get Next All-Link Record',  3,  '_ignore'),
+     0x6B: _CommandType('Set IM Configuration',      4,  '_ignore'),
+     0x6C: _CommandType('Get All-Link Rec for Sndr', 3,  '_ignore'),
+     0x6D: _CommandType('LED On',                    3,  '_ignore'),
+     0x6E: _CommandType('LED Off',                   3,  '_ignore'),
+     0x6F: _CommandType('Manage All-Link Record',    12, '_ignore'),
+     0x70: _CommandType('Set Insteon NAK Byte',      4,  '_ignore'),
+     0x71: _CommandType('Set Insteon ACK Two Bytes', 5,  '_ignore'),
+     0x72: _CommandType('RF Sleep',                  3,  '_ignore'),
+     0x73: _CommandType('Get IM Configuration',      6,  '_ignore')}
+
+#: Message type info indexed by byte 2 (None for unknown types)
+_InsteonCommandTypes = tuple(_COMMAND_TYPES.get(i) for i in range(256))
 
 
 class Message(pyHome.core.Message):
@@ -33,184 +103,107 @@ class Message(pyHome.core.Message):
 
     The relationships used in this class are specific
     to the Insteon PLMs (and only tested on the 2413U so far)
+    
+    The command tables are shared, read-only module-level tuples indexed by
+    byte value, so creating a message only allocates its bytes.
     """
-    def __init__(self, data=None):
-        pyHome.core.Message.__init__(self, data)
-
-        # Motion sensor command info
-        # http://www.fancygaphtrn.com/home-automation/insteon/13627
-        
-        # What can be in command byte 1, and how to process byte 2, if applicable
-        # http://www.madreporite.com/insteon/commands.htm
-        self._InsteonCommands = {0x11:{'State':'On', 'Default':100, 
-                                       'Fcn':lambda x: int(round(x/2.55))},
-                                 0x12:{'State':'On', 'Default':100, 
-                                       'Fcn':lambda x: int(round(x/2.55))},
-                                 0x13:{'State':'Off','Default':0},
-                                 0x14:{'State':'Off','Default':0},
-                                 0x2E:{'State':'On', 'Default':100, 
-                                       'Fcn':lambda x: int((x >> 4)/15.*100)},
-                                 0x2F:{'State':'Off','Default':0}}
-                                 
-
-        # Parse the 2nd byte to get the command type, length, and callback
-        self._InsteonCommandTypes = \
-            {0x50:{'Name':'Insteon Standard Received', 'Length':11,
-                   'Callback':self.__process_insteon_std_recv},
-             0x51:{'Name':'Insteon Extended Received', 'Length':25,
-                   'Callback':self.__ignore},
-             0x52:{'Name':'X10 Received',              'Length':4, 
-                   'Callback':self.__ignore},
-             0x53:{'Name':'All-Link Complete',         'Length':10,
-                   'Callback':self.__ignore},
-             0x54:{'Name':'Button Event Report',       'Length':3, 
-                   'Callback':self.__ignore},
-             0x55:{'Name':'User Reset Detected',       'Length':2, 
-                   'Callback':self.__ignore},
-             0x56:{'Name':'All-Link Cleanup Failure',  'Length':7, 
-                   'Callback':self.__ignore},
-             0x57:{'Name':'All-Link Record Response',  'Length':10,
-                   'Callback':self.__ignore},
-             0x58:{'Name':'All-Link Cleanup Report',   'Length':3, 
-                   'Callback':self.__ignore},
-             0x60:{'Name':'Get IM Info',               'Length':9, 
-                   'Callback':self.__ignore},
-             0x61:{'Name':'Send All-Link Command',     'Length':6, 
-                   'Callback':self.__ignore},
-             0x62:{'Name':'Send Insteon Message',      'Length':9, 
-                   'Callback':self.__process_insteon_cmd_echo},
-             0x63:{'Name':'Send X10 Message',          'Length':5, 
-                   'Callback':self.__ignore},
-             0x64:{'Name':'Start All-Linking',         'Length':5, 
-                   'Callback':self.__ignore},
-             0x65:{'Name':'Cancel All-Linking',        'Length':3, 
-                   'Callback':self.__ignore},
-             0x66:{'Name':'Set Host Device Category',  'Length':6, 
-                   'Callback':self.__ignore},
-             0x67:{'Name':'Reset IM',                  'Length':3, 
-                   'Callback':self.__ignore},
-             0x68:{'Name':'Set Insteon ACK Byte',      'Length':4, 
-                   'Callback':self.__ignore},
-             0x69:{'Name':'Get First All-Link Record', 'Length':3, 
-                   'Callback':self.__ignore},
-             0x6A:{'Name':'Get Next All-Link Record',  'Length':3, 
-                   'Callback':self.__ignore},
-             0x6B:{'Name':'Set IM Configuration',      'Length':4, 
-                   'Callback':self.__ignore},
-             0x6C:{'Name':'Get All-Link Rec for Sndr', 'Length':3, 
-                   'Callback':self.__ignore},
-             0x6D:{'Name':'LED On',                    'Length':3, 
-                   'Callback':self.__ignore},
-             0x6E:{'Name':'LED Off',                   'Length':3, 
-                   'Callback':self.__ignore},
-             0x6F:{'Name':'Manage All-Link Record',    'Length':12,
-                   'Callback':self.__ignore},
-             0x70:{'Name':'Set Insteon NAK Byte',      'Length':4, 
-                   'Callback':self.__ignore},
-             0x71:{'Name':'Set Insteon ACK Two Bytes', 'Length':5, 
-                   'Callback':self.__ignore},
-             0x72:{'Name':'RF Sleep',                  'Length':3, 
-                   'Callback':self.__ignore},
-             0x73:{'Name':'Get IM Configuration',      'Length':6, 
-                   'Callback':self.__ignore}}
+    __slots__ = ()
 
 
     def process(self, house):
         """ Locate the processor for this message and call it """
-        try:
-            self._InsteonCommandTypes[self._data[1]]['Callback'](house)
-        except (IndexError, KeyError):
-            print "Unable to process message:", self
+        msg_type = _InsteonCommandTypes[self._data[1]] \
+                   if len(self._data) > 1 else None
+        if msg_type is None:
+            _log.warning("Unable to process message: %s", self)
+        else:
+            getattr(self, msg_type.callback)(house)
 
 
-    def __ignore(self, house):
+    def _ignore(self, house):
         """ Graveyard for unsupported message types """
-        print "Ignoring:", self
+        _log.debug("Ignoring: %s", self)
 
 
-    def __process_insteon_cmd_echo(self, house):
+    def _process_insteon_cmd_echo(self, house):
         """ Do nothing with echo messages """
-        print "Got echo:", self
+        _log.debug("Got echo: %s", self)
         
     
-    def __process_insteon_std_recv(self, house):
+    def _process_insteon_std_recv(self, house):
         """
         Process 0x50 messages received by the PLM.
         
         This is the most common type of message, and is usually in response
-        to a change in a physical device state.
-        
+        to a change in a physical device state. It puts an :class:`Event` on
+        the house event queue.
         """
+        data = self._data
+        
         # Parse message flag byte
-        msg_flag = self._data[8]
+        msg_flag = data[8]
         
         is_broadcast = msg_flag & 1<<7 == 1<<7
         is_ack_direct = msg_flag & 1<<5 == 1<<5
         
-        # Get sender address and global type
-        self.sender = self._data[2:5]
-        self.type = 'Direct' if not is_broadcast else 'Broadcast'
-        
-        print "Msg:", self
-        print "Broadcast:", is_broadcast
-        print "Ack direct:", is_ack_direct
+        _log.debug("Msg: %s Broadcast: %s Ack direct: %s", self, 
+                   is_broadcast, is_ack_direct)
 
         # Parse message command
-        cmd = self._data[9:11]
-        try:
-            newstate = self._InsteonCommands[cmd[0]]['State']
+        command = _InsteonCommands[data[9]]
+        if command is None:
+            _log.warning("Insteon command '%02X' not found in message %s",
+                         data[9], self)
+            return
             
-            if self._InsteonCommands[cmd[0]].has_key('Fcn') and is_ack_direct:
-                newlevel = self._InsteonCommands[cmd[0]]['Fcn'](cmd[1])
-            else:
-                newlevel = self._InsteonCommands[cmd[0]]['Default']
+        if command.level is not None and is_ack_direct:
+            newlevel = command.level(data[10])
+        else:
+            newlevel = command.default
 
-            self.state = (newstate, newlevel)
+        # Add to event_queue
+        sender = (data[2] << 16) | (data[3] << 8) | data[4]
+        house.event_queue.put(Event(sender, msg_flag, data[9], data[10], 
+                                    (command.state, newlevel), time.time(),
+                                    self.source))
 
-            # Add to event_queue
-            house.event_queue.put(copy.deepcopy(self))
-        
-        except KeyError:
-            print "Insteon key error with command '%02X' not found" % cmd[0]
-            print "  Entire message is:", self
-            print "  Type is:", self.type
-            print "  Sender is:", self.sender
-            print "  Command is:", cmd
 
+    def command_name(self):
+        """ The command byte (cmd1) of a 0x62 message, like '0x11' """
+        if len(self._data) < 8 or self._data[1] != 0x62:
+            return None
+        return '0x%02X' % self._data[6]
 
 
+    def coalesce_key(self):
+        """
+        Standard direct commands (0x62) to the same device coalesce by command
+        class. The on, off and ramp commands all set the light level, so they
+        share one class and only the newest one waiting is sent.
+        """
+        if len(self._data) != 8 or self._data[1] != 0x62:
+            return None
+
+        cmd1 = self._data[6]
+        cmd_class = 'Level' if _InsteonCommands[cmd1] is not None else cmd1
+        return (tuple(self._data[2:5]), cmd_class)
+
 
     def is_complete(self):
-        """ 
+        """
         Check if the message is complete. This checks that it is the proper
         length and that it is not corrupted.
         """
         # If the message is corrupted, attempt to repair it then
         # check again to see if it is complete.
         if self._is_corrupted():
-            print "Attempting to repair corrupted message", self
+            _log.warning("Attempting to repair corrupted message %s", self)
             self._repair()
             return self.is_complete()
             
-        try:
-            target_length = -1
-            
-            #Check for a NAK - If it's a NAK we can stop here
-            if self._data == [0x15]:
-                return True
-
-            #The message length is defined by the code in Byte 2
-            target_length = self._InsteonCommandTypes[self._data[1]]['Length']
-
-            #The one exception is 0x62, which can be standard or extended length
-            if self._data[1] == 0x62:
-                if self._data[5] & 1<<4 == 1<<4: # Bit 4 == 1?
-                    target_length = 23      # Catch extended messages echoed from 0x62 message types
-                    
-            return len(self._data) == target_length
-        
-        except IndexError:
-            return False
+        # The decoder imports the command tables from this module
+        from decoder import frame_length
+        return frame_length(self._data) == len(self._data)
 
 
     def _is_corrupted(self):
@@ -224,7 +217,7 @@ class Message(pyHome.core.Message):
             return True
 
         elif len(self._data) > 1: # If it has 2 or more bytes, they should form this pattern
-            return not (self._data[0] == 0x02 and self._InsteonCommandTypes.has_key(self._data[1]))
+            return not (self._data[0] == 0x02 and _InsteonCommandTypes[self._data[1]] is not None)
 
         elif len(self._data) > 0: # If it has only 1 byte, it must be 0x02 or 0x15
             return not (self._data[0] == 0x02 or self._data[0] == 0x15)
@@ -237,17 +230,21 @@ class Message(pyHome.core.Message):
         """
         The message repair function starts removing entries from the front of corrupted
         messages which do not start with 0x02. It repeats this until either the message is
-        erased, or begins with a valid two-byte combination (0x02 and a valid type byte).
+        erased, or begins with a valid two-byte combination (0x02 and a valid type byte)
+        and is no longer than the largest message.
         This method will discard any NAK messages that showed up too, but I don't know how
         else to distinguish a NAK from an 0x15 in the middle of another message.
         """
+        self._raw = None
         while len(self._data) > 0:
-            if self._data[0] != 0x02:
-                self._data.pop(0)
+            start = self._data.find('\x02')
+            if start < 0:
+                self.clear()
+            else:
+                del self._data[:start]
+            
+            if len(self._data) > 25 or (len(self._data) > 1 and 
+                    _InsteonCommandTypes[self._data[1]] is None):
+                del self._data[0]
             else:
                 break
-
-        if len(self._data) > 1:
-            if not self._InsteonCommandTypes.has_key(self._data[1]):
-                self._data.pop(0)
-                self._repair()
@@ -25,15 +25,69 @@ SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
 import pyHome.core
 from message import Message
+from decoder import Decoder
+from scheduler import CommandScheduler
 
 class PLM(pyHome.core.PLM):
     """
     Provide an interface with the Insteon PLM. This is a dedicated PLM thread
     with a send_queue that other devices can add message to. Received messages
     are processed and passed on according to their type.
+    
+    Outgoing messages are sent by a :class:`CommandScheduler`, which waits for
+    the PLM to echo and ACK each one and retries the ones it NAKs. Received
+    bytes are split into messages by a streaming :class:`Decoder`.
     """
-    def __init__(self, house, usbport, baud=19200, timeout=0):
-        pyHome.core.PLM.__init__(self, house, usbport, baud, timeout)
+    def __init__(self, house, usbport, baud=19200, timeout=0, io_mode='poll',
+                 max_in_flight=1):
+        pyHome.core.PLM.__init__(self, house, usbport, baud, timeout, io_mode)
         self._message = Message()
+        self._decoder = Decoder()
+        self.scheduler = CommandScheduler(self.send_queue, self._write,
+                                          max_in_flight=max_in_flight)
+        
+        
+    def get_send_stats(self):
+        """
+        Get the send queue depth, retry counts, command rate and the number
+        of commands that were coalesced away in the send queue
+        """
+        stats = self.scheduler.get_stats()
+        stats['Coalesced'] = self.send_queue.coalesced
+        return stats
+        
+        
+    def get_line_stats(self):
+        """
+        Get the receive line quality: messages and NAKs decoded, and bytes
+        discarded while resynchronizing
+        """
+        return self._decoder.get_stats()
+        
+        
+    def feed(self, data):
+        """
+        Process a string of received bytes as if it had been read from the
+        serial port. This is used to replay captured traffic.
+        """
+        for frame in self._decoder.feed(data):
+            self._handle_message(frame)
+        
+        
+    def _send_queued(self):
+        """ Let the scheduler send whatever it can """
+        self.scheduler.service()
+        
+        
+    def _next_timeout(self):
+        return self.scheduler.next_timeout()
+        
+        
+    def _handle_message(self, frame):
+        """ Pass PLM echoes and NAKs to the scheduler before processing """
+        if frame[0] == 0x15 or frame[1] == 0x62:
+            self.scheduler.handle_reply(frame)
+            
+        pyHome.core.PLM._handle_message(self, frame)
 
 
@@ -0,0 +1,201 @@
+"""
+Copyright (c) 2012, Tyler Voskuilen
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met: 
+
+1. Redistributions of source code must retain the above copyright notice, this
+   list of conditions and the following disclaimer. 
+2. Redistributions in binary form must reproduce the above copyright notice,
+   this list of conditions and the following disclaimer in the documentation
+   and/or other materials provided with the distribution. 
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR
+ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+(INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+(INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+
+import collections
+import Queue
+
+from pyHome.core.clock import monotonic
+from pyHome.core.log import get_logger
+
+_log = get_logger('plm')
+
+
+class _Command(object):
+    """ A queued message along with its send history """
+    def __init__(self, msg):
+        self.msg = msg
+        self.data = msg.get_byte_string()
+        self.retries = 0
+        self.sent_time = None   # When it was last written to the PLM
+        self.due_time = None    # When it may be retried after a NAK
+        
+
+class CommandScheduler(object):
+    """
+    Sends commands from a send queue to the PLM and tracks each one until the
+    PLM echoes it back with an ACK (0x06) or NAK (0x15) byte.
+    
+    The PLM answers a NAK when it is busy, so NAKed commands and commands that
+    are never echoed are retried with exponential backoff. Only max_in_flight
+    commands are written before their echo comes back; the PLM dev guide
+    recommends waiting for each echo, so the default is 1. The next command
+    goes out as soon as the previous one is ACKed.
+    
+    :param send_queue: A queue of :class:`Message` to send
+    :param write: The function that writes a byte string to the PLM
+    """
+    def __init__(self, send_queue, write, max_in_flight=1, max_retries=5,
+                 retry_delay=0.05, echo_timeout=1.0, rate_window=10.):
+        self.send_queue = send_queue
+        self._write = write
+        self.max_in_flight = max_in_flight
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.echo_timeout = echo_timeout
+        self.rate_window = rate_window
+        
+        self._in_flight = []   # Written, waiting for the echo (oldest first)
+        self._retrying = []    # NAKed, waiting for their due_time
+        self._ack_times = collections.deque()
+        self._start_time = None
+        
+        self.sent = 0
+        self.acked = 0
+        self.naks = 0
+        self.retries = 0
+        self.timeouts = 0
+        self.failed = 0
+        
+        
+    def service(self):
+        """
+        Retry timed out and NAKed commands that are due, then write new
+        commands while there is room in the window.
+        """
+        now = monotonic()
+        
+        for cmd in [c for c in self._in_flight 
+                    if now - c.sent_time > self.echo_timeout]:
+            self._in_flight.remove(cmd)
+            self.timeouts += 1
+            self._retry(cmd, now)
+            
+        while len(self._in_flight) < self.max_in_flight:
+            cmd = self._next_command(now)
+            if cmd is None:
+                break
+            if self._start_time is None:
+                self._start_time = now
+            if cmd.msg.timing is not None:
+                cmd.msg.timing.written = now
+            cmd.sent_time = now
+            self._in_flight.append(cmd)
+            self._write(cmd.data)
+            self.sent += 1
+            
+            
+    def handle_reply(self, frame):
+        """
+        Match an echo (0x62 message) or lone NAK from the PLM to the command
+        it answers. frame is the complete message as a bytearray.
+        """
+        now = monotonic()
+        
+        if len(frame) == 1: # A lone NAK answers the oldest command
+            if self._in_flight:
+                self.naks += 1
+                self._retry(self._in_flight.pop(0), now)
+            return
+            
+        echo = str(frame[:-1])
+        for cmd in self._in_flight:
+            if cmd.data == echo:
+                self._in_flight.remove(cmd)
+                if frame[-1] == 0x06:
+                    self.acked += 1
+                    self._ack_times.append(now)
+                    if cmd.msg.timing is not None:
+                        cmd.msg.timing.plm_ack(now)
+                else:
+                    self.naks += 1
+                    self._retry(cmd, now)
+                return
+        
+        
+    def next_timeout(self):
+        """
+        Seconds until the scheduler needs to run again to handle a timeout or
+        retry, or None if it only needs to run when something arrives.
+        """
+        due = [c.sent_time + self.echo_timeout for c in self._in_flight]
+        if self._retrying and len(self._in_flight) < self.max_in_flight:
+            due.append(self._retrying[0].due_time)
+        if not due:
+            return None
+        return max(0., min(due) - monotonic())
+        
+        
+    def get_stats(self):
+        """ Get the queue depth, retry counts and achieved command rate """
+        now = monotonic()
+        while self._ack_times and now - self._ack_times[0] > self.rate_window:
+            self._ack_times.popleft()
+            
+        window = self.rate_window
+        if self._start_time is not None:
+            window = min(window, now - self._start_time)
+            
+        return {'Queue depth': self.send_queue.qsize() + len(self._retrying),
+                'In flight': len(self._in_flight),
+                'Sent': self.sent,
+                'Acked': self.acked,
+                'NAKs': self.naks,
+                'Retries': self.retries,
+                'Timeouts': self.timeouts,
+                'Failed': self.failed,
+                'Commands/s': len(self._ack_times) / window if window else 0.}
+        
+        
+    def _next_command(self, now):
+        """
+        Get the next command to write. Pending retries go first and hold back
+        newer commands, so commands to a device are not reordered.
+        """
+        if self._retrying:
+            if self._retrying[0].due_time <= now:
+                return self._retrying.pop(0)
+            return None
+            
+        try:
+            msg = self.send_queue.get(False)
+        except Queue.Empty:
+            return None
+            
+        if msg.timing is not None:
+            msg.timing.dequeued = now
+        return _Command(msg)
+            
+            
+    def _retry(self, cmd, now):
+        """ Schedule a command to be sent again after a backoff delay """
+        if cmd.retries >= self.max_retries:
+            self.failed += 1
+            _log.warning("Giving up on command: %s", cmd.msg)
+            return
+            
+        cmd.due_time = now + self.retry_delay * 2**cmd.retries
+        cmd.retries += 1
+        self.retries += 1
+        self._retrying.append(cmd)
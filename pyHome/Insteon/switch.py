@@ -23,25 +23,32 @@ ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
 SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 """
 
-from message import Message
+from encoder import Encoder
 
 import pyHome.core
 
 class Switch(pyHome.core.Switch):
     def __init__(self, house, xml):
         pyHome.core.Switch.__init__(self, house, xml)
+        self._encoder = Encoder(self.address)
         
     def turn_on(self, level=100, fast=False):
         """ Turn the light on to level (0-100) at a normal or fast rate """
         level = min(max(0,level),100)
         cmd1 = 0x12 if fast else 0x11
         cmd2 = int(round(level * 2.55))
-        self.send( Message([0x02,0x62]+self.address+[0x0F,cmd1,cmd2]) )
+        self.send( self._message(cmd1, cmd2) )
 
     def turn_off(self, fast=False):
         """ Turn the light off at a normal or fast rate """
         cmd1 = 0x14 if fast else 0x13
-        self.send( Message([0x02,0x62]+self.address+[0x0F,cmd1,0xFF]) )
+        self.send( self._message(cmd1, 0xFF) )
+        
+    def _message(self, cmd1, cmd2):
+        """ Build a message to this device from the encoder's frame cache """
+        if self._encoder.address != self.address:   # Address was edited
+            self._encoder = Encoder(self.address)
+        return self._encoder.message(cmd1, cmd2)
             
             
 
@@ -0,0 +1,232 @@
+"""
+Copyright (c) 2012, Tyler Voskuilen
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met: 
+
+1. Redistributions of source code must retain the above copyright notice, this
+   list of conditions and the following disclaimer. 
+2. Redistributions in binary form must reproduce the above copyright notice,
+   this list of conditions and the following disclaimer in the documentation
+   and/or other materials provided with the distribution. 
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR
+ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+(INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+(INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+
+import os
+import tty
+import heapq
+import errno
+import random
+import select
+import threading
+import xml.etree.ElementTree as ET
+
+from pyHome.core.clock import monotonic
+
+
+def load_devices(devFile):
+    """
+    Read the simulated devices from a pyHome devices.xml file, as a list of
+    {'Address': [a,b,c], 'Type': 'Insteon Dimmer'} dicts
+    """
+    devices = []
+    for d in ET.parse(devFile).getroot().findall("device"):
+        address = [int(x) for x in d.find("address").text.split(":")]
+        devices.append({'Address': address, 'Type': d.get("type")})
+    return devices
+
+
+class VirtualPLM(threading.Thread):
+    """
+    A simulated Insteon PLM (2413U) for testing without hardware. It opens a
+    pseudo-terminal and speaks the PLM serial protocol on it, so pyHome can
+    use the pty name (self.port) as its usbport.
+    
+     * 0x62 commands are echoed with an ACK (or a NAK, nak_rate of the time)
+       and, if they are addressed to a simulated device, that device answers
+       with a direct ACK (0x50) after ack_delay seconds.
+     * 0x60 (Get IM Info) is answered with the PLM's address.
+     * Simulated devices generate manual on/off, motion and open/close events
+       at an average of rate events per second in total. Each event is a
+       group broadcast followed by a cleanup direct message, like real
+       devices send.
+       
+    :param devices: A list of {'Address', 'Type'} dicts (see load_devices)
+    """
+    def __init__(self, devices, rate=0., nak_rate=0., ack_delay=0.05,
+                 address=(0x11,0x22,0x33), seed=None):
+        threading.Thread.__init__(self)
+        self.setDaemon(True)
+        self.devices = devices
+        self.rate = rate
+        self.nak_rate = nak_rate
+        self.ack_delay = ack_delay
+        self.address = list(address)
+        self.running = True
+        self._random = random.Random(seed)
+        
+        self._master, self._slave = os.openpty()
+        tty.setraw(self._slave)
+        
+        #: The pty name to open as the PLM serial port
+        self.port = os.ttyname(self._slave)
+        
+        self._rx = bytearray()
+        self._outgoing = []   # Heap of (due time, sequence, frame)
+        self._sequence = 0
+        self._levels = {}     # Simulated on/off state by device address
+        
+        self.commands_received = 0
+        self.naks_sent = 0
+        self.frames_sent = 0
+        self.events_generated = 0
+        
+        
+    def stop(self):
+        """ Stop the simulator """
+        self.running = False
+        
+        
+    def get_stats(self):
+        """ Get the simulator traffic counters """
+        return {'Commands received': self.commands_received,
+                'NAKs sent': self.naks_sent,
+                'Frames sent': self.frames_sent,
+                'Events generated': self.events_generated}
+        
+        
+    def run(self):
+        next_event = self._next_event_time(monotonic())
+        
+        while self.running:
+            now = monotonic()
+            
+            if next_event is not None and now >= next_event:
+                self._generate_event(now)
+                next_event = self._next_event_time(next_event)
+                
+            while self._outgoing and self._outgoing[0][0] <= now:
+                self._write(heapq.heappop(self._outgoing)[2])
+                
+            due = [t for t in (next_event, 
+                   self._outgoing[0][0] if self._outgoing else None)
+                   if t is not None]
+            timeout = max(0., min(due) - now) if due else 0.5
+            
+            try:
+                ready = select.select([self._master], [], [], 
+                                      min(timeout, 0.5))[0]
+            except select.error as e:
+                if e.args[0] == errno.EINTR:
+                    continue
+                raise
+                
+            if ready:
+                self._rx.extend(os.read(self._master, 4096))
+                self._process_commands()
+                
+        os.close(self._master)
+        os.close(self._slave)
+        
+        
+    def _process_commands(self):
+        """ Answer every complete command from the host """
+        while self._rx:
+            if self._rx[0] != 0x02:
+                del self._rx[0]
+                continue
+            if len(self._rx) < 2:
+                return
+                
+            if self._rx[1] == 0x62:
+                if len(self._rx) < 6:
+                    return
+                length = 22 if self._rx[5] & 1<<4 else 8
+                if len(self._rx) < length:
+                    return
+                cmd = self._rx[:length]
+                del self._rx[:length]
+                self._answer_send(cmd)
+                
+            elif self._rx[1] == 0x60:
+                del self._rx[:2]
+                self.commands_received += 1
+                self._queue(0., [0x02,0x60]+self.address+[0x03,0x15,0x9B,0x06])
+                
+            else:
+                # Unsupported command, NAK it and drop what we have
+                del self._rx[:]
+                self.commands_received += 1
+                self.naks_sent += 1
+                self._queue(0., [0x15])
+                
+                
+    def _answer_send(self, cmd):
+        """ Echo a 0x62 command and have the target device ACK it """
+        self.commands_received += 1
+        
+        if self._random.random() < self.nak_rate:
+            self.naks_sent += 1
+            self._queue(0., cmd + bytearray([0x15]))
+            return
+            
+        self._queue(0., cmd + bytearray([0x06]))
+        
+        target = list(cmd[2:5])
+        if target in [d['Address'] for d in self.devices]:
+            cmd1, cmd2 = cmd[6], cmd[7]
+            if cmd1 in (0x13, 0x14, 0x2F):
+                cmd2 = 0x00
+            self._levels[tuple(target)] = cmd1 not in (0x13, 0x14, 0x2F)
+            self._queue(self.ack_delay, 
+                        [0x02,0x50]+target+self.address+[0x2F,cmd1,cmd2])
+            
+            
+    def _generate_event(self, now):
+        """ Have a random simulated device report a change in its state """
+        if not self.devices:
+            return
+            
+        device = self._random.choice(self.devices)
+        address = device['Address']
+        on = not self._levels.get(tuple(address), False)
+        self._levels[tuple(address)] = on
+        cmd1 = 0x11 if on else 0x13
+        cmd2 = 0xFF if on and 'Sensor' not in device['Type'] else 0x00
+        
+        # Group broadcast, then cleanup direct to the PLM
+        self._queue(0., [0x02,0x50]+address+[0x00,0x00,0x01,0xCF,cmd1,cmd2])
+        self._queue(0.05, [0x02,0x50]+address+self.address+[0x4F,cmd1,0x01])
+        self.events_generated += 1
+        
+        
+    def _next_event_time(self, last):
+        """ Time of the next device event, with Poisson arrivals """
+        if self.rate <= 0.:
+            return None
+        return last + self._random.expovariate(self.rate)
+        
+        
+    def _queue(self, delay, frame):
+        """ Queue a frame to be written to the host after delay seconds """
+        self._sequence += 1
+        heapq.heappush(self._outgoing, (monotonic() + delay, self._sequence,
+                                        str(bytearray(frame))))
+                                        
+                                        
+    def _write(self, data):
+        """ Write a frame to the host """
+        while data:
+            data = data[os.write(self._master, data):]
+        self.frames_sent += 1
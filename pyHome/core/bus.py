@@ -0,0 +1,151 @@
+"""
+Copyright (c) 2012, Tyler Voskuilen
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met: 
+
+1. Redistributions of source code must retain the above copyright notice, this
+   list of conditions and the following disclaimer. 
+2. Redistributions in binary form must reproduce the above copyright notice,
+   this list of conditions and the following disclaimer in the documentation
+   and/or other materials provided with the distribution. 
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR
+ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+(INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+(INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+
+import time
+import threading
+import collections
+
+from log import get_logger
+
+_log = get_logger('house')
+
+
+#: A device state change, from old to new state, published at time.time()
+StateChange = collections.namedtuple('StateChange', 'device old new time')
+
+
+class Subscription(object):
+    """
+    A callback on a :class:`StateBus` with its filters. Each filter is None
+    to match anything, or a set of device tags, room names or device types.
+    """
+    def __init__(self, bus, callback, devices=None, rooms=None, types=None):
+        self.bus = bus
+        self.callback = callback
+        self.devices = None if devices is None else \
+                       set(getattr(d, 'tag', d) for d in devices)
+        self.rooms = None if rooms is None else set(rooms)
+        self.types = None if types is None else set(types)
+        
+    def matches(self, change):
+        device = change.device
+        return (self.devices is None or device.tag in self.devices) and \
+               (self.rooms is None or device.room in self.rooms) and \
+               (self.types is None or device.type in self.types)
+               
+    def cancel(self):
+        """ Stop receiving changes """
+        self.bus.unsubscribe(self)
+        
+        
+class StateBus(object):
+    """
+    Delivers device state changes to subscribers in batches.
+    
+    Devices :meth:`publish` their changes from any thread. The house main
+    loop calls :meth:`flush` once per cycle, which calls each subscriber 
+    once with the list of changes that match its filters, in the house
+    thread. Subscribers that get nothing are not called.
+    
+    If *wake* is given, it is called when a change is published to an empty
+    bus, so the owner can flush it soon.
+    """
+    def __init__(self, wake=None):
+        self.lock = threading.Lock()
+        self._wake = wake
+        self._pending = []
+        self._subscriptions = ()  # Replaced, never changed, so flush can
+                                  # iterate it without the lock
+        
+        
+    def __len__(self):
+        return len(self._pending)
+        
+        
+    def subscribe(self, callback, devices=None, rooms=None, types=None):
+        """
+        Call callback(changes) with each batch of changes to the given 
+        devices (objects or tags), rooms or device types. Returns the
+        :class:`Subscription`.
+        """
+        sub = Subscription(self, callback, devices, rooms, types)
+        self.lock.acquire()
+        try:
+            self._subscriptions = self._subscriptions + (sub,)
+        finally:
+            self.lock.release()
+        return sub
+        
+        
+    def unsubscribe(self, sub):
+        self.lock.acquire()
+        try:
+            self._subscriptions = tuple(s for s in self._subscriptions 
+                                        if s is not sub)
+        finally:
+            self.lock.release()
+            
+            
+    def publish(self, device, old, new):
+        """ Queue a state change of device for the next flush """
+        change = StateChange(device, old, new, time.time())
+        self.lock.acquire()
+        try:
+            self._pending.append(change)
+            first = len(self._pending) == 1
+        finally:
+            self.lock.release()
+            
+        if first and self._wake is not None:
+            self._wake()
+            
+            
+    def flush(self):
+        """
+        Deliver the changes published since the last flush. Returns the list
+        of all of them.
+        """
+        self.lock.acquire()
+        try:
+            changes, self._pending = self._pending, []
+            subscriptions = self._subscriptions
+        finally:
+            self.lock.release()
+            
+        if not changes:
+            return changes
+            
+        for sub in subscriptions:
+            if sub.devices is None and sub.rooms is None and sub.types is None:
+                batch = changes
+            else:
+                batch = [c for c in changes if sub.matches(c)]
+            if batch:
+                try:
+                    sub.callback(batch)
+                except Exception:
+                    _log.exception("State change subscriber %r failed", 
+                                   sub.callback)
+        return changes
@@ -0,0 +1,156 @@
+"""
+Copyright (c) 2012, Tyler Voskuilen
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met: 
+
+1. Redistributions of source code must retain the above copyright notice, this
+   list of conditions and the following disclaimer. 
+2. Redistributions in binary form must reproduce the above copyright notice,
+   this list of conditions and the following disclaimer in the documentation
+   and/or other materials provided with the distribution. 
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR
+ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+(INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+(INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+
+import mmap
+import time
+import struct
+import threading
+
+from clock import monotonic
+
+#: Record directions
+RX = 0   # Bytes read from the PLM
+TX = 1   # Bytes written to the PLM
+
+_MAGIC = 'PYHCAP1\n'
+_RECORD = struct.Struct('<dBH')  # Timestamp, direction, data length
+
+
+class CaptureWriter(object):
+    """
+    Records raw serial traffic to a compact binary capture file. The file is
+    an 8 byte header followed by one record per read or write: a little
+    endian double monotonic timestamp, a direction byte (RX or TX), an
+    unsigned short data length, then the data.
+    """
+    def __init__(self, path):
+        self.lock = threading.Lock()
+        self.path = path
+        self._file = open(path, 'wb')
+        self._file.write(_MAGIC)
+        self.records = 0
+        self.bytes = 0
+        
+        
+    def record(self, direction, data):
+        """ Append one read or write to the capture """
+        self.lock.acquire()
+        try:
+            if self._file is None:
+                return
+            # Split anything too long for the length field
+            for i in range(0, len(data), 0xFFFF):
+                chunk = data[i:i+0xFFFF]
+                self._file.write(_RECORD.pack(monotonic(), direction, 
+                                              len(chunk)))
+                self._file.write(chunk)
+                self.records += 1
+            self.bytes += len(data)
+        finally:
+            self.lock.release()
+            
+            
+    def close(self):
+        self.lock.acquire()
+        try:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+        finally:
+            self.lock.release()
+            
+            
+class CaptureReader(object):
+    """
+    Reads a capture file written by :class:`CaptureWriter`. The file is
+    memory-mapped, so iterating over even a very large capture only touches
+    the records as they are read. Iterating yields (timestamp, direction,
+    data) tuples.
+    """
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'rb')
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._map[:len(_MAGIC)] != _MAGIC:
+            self.close()
+            raise ValueError("%s is not a pyHome capture file" % path)
+            
+            
+    def __iter__(self):
+        mm = self._map
+        pos = len(_MAGIC)
+        end = len(mm) - _RECORD.size
+        while pos <= end:
+            timestamp, direction, length = _RECORD.unpack_from(mm, pos)
+            pos += _RECORD.size
+            if pos + length > len(mm):
+                break  # Truncated final record
+            yield timestamp, direction, mm[pos:pos+length]
+            pos += length
+            
+            
+    def close(self):
+        self._map.close()
+        self._file.close()
+        
+        
+def replay(house, path, realtime=False, speed=1.):
+    """
+    Feed the received traffic in a capture file through the house PLM's 
+    message parser and the house's event handling. Like the house main loop,
+    this fires the due house timers and delivers the state changes to the
+    house bus subscribers after each chunk. The PLM thread should not
+    be running. With realtime=True the original timing is kept (scaled by
+    speed), otherwise the capture is replayed as fast as possible.
+    
+    Returns a dict with the number of bytes and events replayed and the time
+    it took.
+    """
+    reader = CaptureReader(path)
+    nbytes = 0
+    events = 0
+    first = None
+    start = monotonic()
+    try:
+        for timestamp, direction, data in reader:
+            if direction != RX:
+                continue
+                
+            if realtime:
+                if first is None:
+                    first = timestamp
+                delay = (timestamp - first) / speed - (monotonic() - start)
+                if delay > 0.:
+                    time.sleep(delay)
+                    
+            house.PLM.feed(data)
+            events += house.process_events()
+            house.timers.run_due()
+            house.changes = house.bus.flush()
+            nbytes += len(data)
+    finally:
+        reader.close()
+        
+    return {'Bytes': nbytes, 'Events': events, 'Elapsed': monotonic() - start}
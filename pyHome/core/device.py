@@ -24,6 +24,7 @@ SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 """
 
 import threading
+import xml.etree.ElementTree as ET
 
 class Device(object):
     """
@@ -46,6 +47,12 @@ class Device(object):
         self.room = xml.get("room")   # Device room
         self.type = xml.get("type")   # Device type
         self.address = [int(x) for x in xml.find("address").text.split(":")]
+        
+        # Port of the PLM used to reach this device. If it is not set in the
+        # XML file, it is learned from the first PLM that hears the device
+        # and saved in the file.
+        plm = xml.find("plm")
+        self.plm = plm.text if plm is not None else None
 
         self.pos = xml.find("pos").text
         if self.pos is not None:
@@ -72,16 +79,37 @@ class Device(object):
         """ 
         Set the device state. Locked for thread safety, although
         currently only the House class changes device states.
+        Changes are published on the house state bus.
         """
+        old_state = self.state
         self.state = new_state
-
-    def update(self):
-        """ Update device timers or states """
-        pass   
+        if new_state != old_state:
+            self.house.bus.publish(self, old_state, new_state)
             
-    def send(self, msg):
-        """ Put a message in the house's PLM's send queue """
-        self.house.PLM.send_queue.put( msg )
+    def send(self, msg, priority=None):
+        """ 
+        Put a message in the send queue of the PLM that reaches this device.
+        The priority lane defaults to the one set for the calling thread.
+        """
+        self.house.latency.start( msg, self )
+        self.house.route(self).send( msg, priority )
+        
+    def learn_plm(self, port):
+        """
+        Reach this device through the PLM on port from now on, and save it
+        to the XML file like a PLM set there by hand
+        """
+        self.plm = port
+        self.save()
+        
+    def _save_plm(self):
+        """ Put the PLM port in the XML entry. Call with the lock held. """
+        if self.plm is None:
+            return
+        plm = self.xml.find("plm")
+        if plm is None:
+            plm = ET.SubElement(self.xml, "plm")
+        plm.text = self.plm
         
     def save(self):
         """ Save device into XML file """
@@ -94,6 +122,7 @@ class Device(object):
             if self.pos is not None:
                 self.xml.find("pos").text = " ".join([str(x) for x in self.pos])
             self.xml.find("icon").text = self.icon
+            self._save_plm()
             
         finally:
             self.lock.release()
@@ -0,0 +1,64 @@
+"""
+Copyright (c) 2012, Tyler Voskuilen
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met: 
+
+1. Redistributions of source code must retain the above copyright notice, this
+   list of conditions and the following disclaimer. 
+2. Redistributions in binary form must reproduce the above copyright notice,
+   this list of conditions and the following disclaimer in the documentation
+   and/or other materials provided with the distribution. 
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR
+ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+(INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+(INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+
+import Queue
+
+from wakeup import make_wakeup
+
+
+class EventQueue(Queue.Queue):
+    """
+    A Queue that a consumer can wait on without polling.
+    
+    In Python 2, a Queue.get() with a timeout wakes up every few ms until
+    something arrives. Here each put() also wakes a :class:`WakeupPipe`, and
+    :meth:`wait` blocks in select() on the pipe until an item is put, 
+    :meth:`wake` is called, or the timeout runs out. Where there are no
+    pipes to select() on (non-POSIX platforms), it waits on a
+    :class:`WakeupEvent` instead, which polls like Queue.get().
+    """
+    def __init__(self, maxsize=0):
+        Queue.Queue.__init__(self, maxsize)
+        self._wakeup = make_wakeup()
+        
+        
+    def put(self, item, block=True, timeout=None):
+        Queue.Queue.put(self, item, block, timeout)
+        self.wake()
+        
+        
+    def wake(self):
+        """ Make a waiting consumer return from wait() """
+        self._wakeup.wake()
+        
+        
+    def wait(self, timeout=None):
+        """
+        Wait until the queue has items, wake() is called, or timeout seconds
+        pass (forever if timeout is None). Returns True if the queue has items.
+        """
+        if self.empty():
+            self._wakeup.wait(timeout)
+        return not self.empty()
@@ -0,0 +1,202 @@
+"""
+Copyright (c) 2012, Tyler Voskuilen
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met: 
+
+1. Redistributions of source code must retain the above copyright notice, this
+   list of conditions and the following disclaimer. 
+2. Redistributions in binary form must reproduce the above copyright notice,
+   this list of conditions and the following disclaimer in the documentation
+   and/or other materials provided with the distribution. 
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR
+ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+(INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+(INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+
+import json
+import threading
+import collections
+
+from clock import monotonic
+from stats import RollingStats
+
+
+class CommandTiming(object):
+    """
+    Monotonic timestamps for one outgoing command as it goes through the
+    house. Each is None until the command reaches that point.
+    """
+    def __init__(self, tracker, device, address, command):
+        self.tracker = tracker
+        self.device = device      # Device name
+        self.address = address    # Device address as a tuple
+        self.command = command    # Command name
+        self.queued = monotonic() # Put in the send queue
+        self.dequeued = None      # Taken from the send queue
+        self.written = None       # Last written to the PLM
+        self.acked = None         # ACKed by the PLM echo
+        self.completed = None     # ACKed by the device
+        
+    def plm_ack(self, now):
+        """ Mark the PLM ACK and start waiting for the device's ACK """
+        self.acked = now
+        self.tracker._await_device(self)
+        
+        
+class LatencyTracker(object):
+    """
+    Times every outgoing command from when a device sends it until the
+    device ACKs it, and keeps rolling statistics of each stage for every
+    device and every command type:
+    
+     * *Queue* - Waiting in the PLM send queue
+     * *Write* - From leaving the queue until the final write to the PLM,
+       including any retry backoff
+     * *PLM ACK* - From the write until the PLM echoes it with an ACK
+     * *Device ACK* - From the PLM ACK until the device's direct ACK is
+       applied by the house
+     * *Total* - From the send queue to the device ACK
+    """
+    stages = ('Queue', 'Write', 'PLM ACK', 'Device ACK', 'Total')
+    
+    #: Default histogram bin edges in seconds
+    edges = [0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1., 2., 5.]
+    
+    def __init__(self, size=1000, ack_timeout=10., max_waiting=100):
+        self.lock = threading.Lock()
+        self.size = size
+        self.ack_timeout = ack_timeout
+        
+        #: Most commands kept waiting for each device's ACK. Older ones are
+        #: counted as lost.
+        self.max_waiting = max_waiting
+        self._waiting = collections.defaultdict(collections.deque)
+        self._last_sweep = monotonic()
+        self._devices = {}
+        self._commands = {}
+        
+        #: Commands the PLM ACKed that the device never ACKed
+        self.lost = 0
+        
+        
+    def start(self, msg, device):
+        """ Start timing a message that device is putting in the queue """
+        msg.timing = CommandTiming(self, device.name, tuple(device.address),
+                                   msg.command_name())
+        
+        
+    def device_ack(self, address):
+        """
+        Finish timing the oldest PLM ACKed command to address, now that the
+        device has ACKed it
+        """
+        now = monotonic()
+        self.lock.acquire()
+        try:
+            waiting = self._waiting.get(tuple(address))
+            self._expire(waiting, now)
+            if not waiting:
+                return
+            timing = waiting.popleft()
+            timing.completed = now
+            self._record(timing)
+        finally:
+            self.lock.release()
+            
+            
+    def get_stats(self, device=None, command=None):
+        """
+        Get the latency percentiles of each stage for a device name or a
+        command name. With neither, get them for every device and command.
+        """
+        self.lock.acquire()
+        try:
+            self._sweep(monotonic())
+            if device is not None:
+                return self._summarize(self._devices.get(device, {}))
+            if command is not None:
+                return self._summarize(self._commands.get(command, {}))
+            return {'Devices': dict((k, self._summarize(v)) 
+                                    for k, v in self._devices.iteritems()),
+                    'Commands': dict((k, self._summarize(v)) 
+                                     for k, v in self._commands.iteritems()),
+                    'Lost': self.lost}
+        finally:
+            self.lock.release()
+            
+            
+    def dump(self, path):
+        """ Write the statistics and histograms to a JSON file """
+        stats = self.get_stats()
+        stats['Histogram edges'] = self.edges
+        with open(path, 'w') as f:
+            json.dump(stats, f, indent=2, sort_keys=True)
+            
+            
+    def _await_device(self, timing):
+        now = monotonic()
+        self.lock.acquire()
+        try:
+            waiting = self._waiting[timing.address]
+            self._expire(waiting, now)
+            waiting.append(timing)
+            while len(waiting) > self.max_waiting:
+                waiting.popleft()
+                self.lost += 1
+                
+            # Devices that never ACK are not expired by device_ack()
+            if now - self._last_sweep > self.ack_timeout:
+                self._sweep(now)
+        finally:
+            self.lock.release()
+            
+            
+    def _expire(self, waiting, now):
+        """ Drop commands that waited too long for their device's ACK """
+        while waiting and now - waiting[0].acked > self.ack_timeout:
+            waiting.popleft()
+            self.lost += 1
+            
+            
+    def _sweep(self, now):
+        """ Expire the commands waiting for every device (locked) """
+        self._last_sweep = now
+        for address, waiting in self._waiting.items():
+            self._expire(waiting, now)
+            if not waiting:
+                del self._waiting[address]
+                
+                
+    def _record(self, timing):
+        durations = {'Queue': (timing.queued, timing.dequeued),
+                     'Write': (timing.dequeued, timing.written),
+                     'PLM ACK': (timing.written, timing.acked),
+                     'Device ACK': (timing.acked, timing.completed),
+                     'Total': (timing.queued, timing.completed)}
+                     
+        for table, key in ((self._devices, timing.device), 
+                           (self._commands, timing.command)):
+            if key not in table:
+                table[key] = dict((s, RollingStats(self.size)) 
+                                  for s in self.stages)
+            for stage, (start, end) in durations.iteritems():
+                if start is not None and end is not None:
+                    table[key][stage].add(end - start)
+                    
+                    
+    def _summarize(self, stages):
+        summary = {}
+        for stage, stats in stages.iteritems():
+            summary[stage] = stats.summary()
+            summary[stage]['Histogram'] = stats.histogram(self.edges)
+        return summary
@@ -0,0 +1,172 @@
+"""
+Copyright (c) 2012, Tyler Voskuilen
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met: 
+
+1. Redistributions of source code must retain the above copyright notice, this
+   list of conditions and the following disclaimer. 
+2. Redistributions in binary form must reproduce the above copyright notice,
+   this list of conditions and the following disclaimer in the documentation
+   and/or other materials provided with the distribution. 
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR
+ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+(INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+(INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+
+import sys
+import Queue
+import logging
+import threading
+import collections
+
+#: Subsystems with their own loggers and levels
+SUBSYSTEMS = ('plm', 'parser', 'house', 'macro', 'gui')
+
+_ROOT = 'pyHome'
+_FORMAT = '%(asctime)s %(levelname)-7s %(name)s: %(message)s'
+
+# Nothing is written until configure() is called
+logging.getLogger(_ROOT).addHandler(logging.NullHandler())
+
+_listener = None
+_tail = None
+
+
+def get_logger(subsystem):
+    """ Get the logger of a subsystem, like get_logger('plm') """
+    return logging.getLogger('%s.%s' % (_ROOT, subsystem))
+    
+    
+def set_level(subsystem, level):
+    """
+    Set the level of a subsystem, or of all of them if subsystem is None.
+    level is a logging level or its name, like 'DEBUG'.
+    """
+    if isinstance(level, basestring):
+        level = level.upper()
+    if subsystem is None:
+        logging.getLogger(_ROOT).setLevel(level)
+    else:
+        get_logger(subsystem).setLevel(level)
+        
+        
+def get_tail(count=None):
+    """ Get the most recent formatted log lines, oldest first """
+    if _tail is None:
+        return []
+    return _tail.get_lines(count)
+    
+    
+def configure(level='INFO', levels=None, stream=sys.stdout, tail=1000):
+    """
+    Start writing pyHome logs to stream from a background thread, and keep
+    the last 'tail' lines in memory. level is the default level, and levels
+    maps subsystem names to their own levels. Calling it again changes the
+    levels but keeps the running writer.
+    
+    Logging calls only queue the record, so the PLM and House threads never
+    wait on the output. Messages are formatted only if their level is
+    enabled.
+    """
+    global _listener, _tail
+    
+    set_level(None, level)
+    for subsystem, sub_level in (levels or {}).iteritems():
+        set_level(subsystem, sub_level)
+        
+    if _listener is not None:
+        return
+        
+    formatter = logging.Formatter(_FORMAT)
+    _tail = TailHandler(tail)
+    _tail.setFormatter(formatter)
+    handlers = [_tail]
+    if stream is not None:
+        console = logging.StreamHandler(stream)
+        console.setFormatter(formatter)
+        handlers.append(console)
+        
+    queue = Queue.Queue()
+    _listener = QueueListener(queue, handlers)
+    _listener.start()
+    logging.getLogger(_ROOT).addHandler(QueueHandler(queue))
+    
+    
+def shutdown():
+    """ Write out any queued records and stop the background writer """
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+        
+        
+class QueueHandler(logging.Handler):
+    """
+    Puts log records on a queue for a :class:`QueueListener` to write. The
+    message is filled in here, since its arguments may change once the call
+    returns (the PLM reuses its parser Message), but the rest of the
+    formatting and the writing happen on the listener thread.
+    """
+    def __init__(self, queue):
+        logging.Handler.__init__(self)
+        self.queue = queue
+        
+    def emit(self, record):
+        try:
+            record.msg = record.getMessage()
+            record.args = None
+            self.queue.put_nowait(record)
+        except Exception:
+            self.handleError(record)
+            
+            
+class QueueListener(threading.Thread):
+    """ Passes records from a queue to handlers on its own thread """
+    def __init__(self, queue, handlers):
+        threading.Thread.__init__(self)
+        self.setDaemon(True)
+        self.queue = queue
+        self.handlers = handlers
+        
+    def run(self):
+        while True:
+            record = self.queue.get()
+            if record is None:
+                break
+            for handler in self.handlers:
+                if record.levelno >= handler.level:
+                    handler.handle(record)
+                    
+    def stop(self):
+        self.queue.put(None)
+        self.join()
+        for handler in self.handlers:
+            handler.flush()
+            
+            
+class TailHandler(logging.Handler):
+    """ Keeps the last 'size' formatted records in memory """
+    def __init__(self, size=1000):
+        logging.Handler.__init__(self)
+        self._lines = collections.deque(maxlen=size)
+        
+    def emit(self, record):
+        self._lines.append(self.format(record))
+        
+    def get_lines(self, count=None):
+        self.acquire()
+        try:
+            lines = list(self._lines)
+        finally:
+            self.release()
+        return lines if count is None else lines[-count:]
@@ -29,6 +29,15 @@ class Macro(object):
     Macro objects contain executable python code. The code is executed in the
     scope of the House, so it can access everything. If the code generates
     any exceptions it is stopped.
+    
+    Active macros run right after any device state changes, which are in
+    the list 'changes' (see :class:`core.bus.StateChange`), and otherwise
+    every 'interval' seconds (set in the macro XML entry, 1 s by default) to
+    catch changes that do not come from a device, like the time.
+    
+    Macros run on the house macro pool threads, one run at a time for each
+    macro. A run longer than 'budget' seconds (also set in the XML entry, 1 s
+    by default) is reported in the house log.
     """
     #----------------------------------------------------------------------  
     def __init__(self, house, xml):
@@ -43,7 +52,12 @@ class Macro(object):
         self.code = xml.find("code").text
         
         self.active = xml.get("active")=="True"
+        self.interval = float(xml.get("interval", 1.))
+        self.budget = float(xml.get("budget", 1.))
         self.errors = ''
+        self.overruns = 0    # Runs that took longer than the budget
+        
+        self.next_run = 0.   # Monotonic time when the macro is due to run
         
     #----------------------------------------------------------------------  
     def register_error(self, error):
@@ -0,0 +1,177 @@
+"""
+Copyright (c) 2012, Tyler Voskuilen
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met: 
+
+1. Redistributions of source code must retain the above copyright notice, this
+   list of conditions and the following disclaimer. 
+2. Redistributions in binary form must reproduce the above copyright notice,
+   this list of conditions and the following disclaimer in the documentation
+   and/or other materials provided with the distribution. 
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR
+ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+(INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+(INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+
+import Queue
+import threading
+
+from clock import monotonic
+from timers import TimerService
+from wakeup import make_wakeup
+from log import get_logger
+
+_log = get_logger('macro')
+
+
+class MacroPool(object):
+    """
+    Runs macros on a fixed number of worker threads, so slow macro code
+    never holds up the house main loop.
+    
+    A macro never runs concurrently with itself. If it is submitted while it
+    is waiting or running, it runs once more when it finishes, with all the 
+    changes submitted in the meantime, however many times it was submitted.
+    
+    Budgets are checked by a watchdog thread with its own timers, so the
+    house main loop is not woken up for them.
+    
+    :param run: run(macro, changes) runs the code of one macro
+    :param report: report(macro, elapsed, finished) is called when a macro
+                   runs longer than its budget (macro.budget seconds), from
+                   the watchdog thread while it is still running and again
+                   from the worker when it finishes
+    :param init: init() is called first in each worker thread
+    :param workers: Number of worker threads
+    """
+    def __init__(self, run, report, init=None, workers=4):
+        self.lock = threading.Lock()
+        self._run = run
+        self._report = report
+        self._init = init
+        self.workers = workers
+        
+        self._queue = Queue.Queue()
+        self._threads = []
+        
+        self._wakeup = make_wakeup()
+        self._timers = TimerService(wake=self._wakeup.wake)
+        self._watching = False
+        
+        # [rerun, changes] of each macro that is waiting or running
+        self._busy = {}
+        
+        # Monotonic start time of each running macro
+        self._running = {}
+        
+        
+    def start(self):
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._work, 
+                                      name='Macro worker %d' % i)
+            thread.setDaemon(True)
+            thread.start()
+            self._threads.append(thread)
+            
+        self._watching = True
+        thread = threading.Thread(target=self._watch, name='Macro watchdog')
+        thread.setDaemon(True)
+        thread.start()
+            
+            
+    def stop(self):
+        """ Stop the workers once they finish the macros already queued """
+        for thread in self._threads:
+            self._queue.put(None)
+        self._threads = []
+        self._watching = False
+        self._wakeup.wake()
+        
+        
+    def submit(self, macro, changes=()):
+        """ Run a macro with a list of state changes """
+        self.lock.acquire()
+        try:
+            busy = self._busy.get(macro)
+            if busy is None:
+                self._busy[macro] = [False, []]
+                self._queue.put((macro, list(changes)))
+            else:
+                busy[0] = True
+                busy[1].extend(changes)
+        finally:
+            self.lock.release()
+            
+            
+    def is_busy(self, macro):
+        """ True if the macro is waiting or running """
+        return macro in self._busy
+        
+        
+    def _work(self):
+        if self._init is not None:
+            self._init()
+            
+        while True:
+            job = self._queue.get()
+            if job is None:
+                break
+            macro, changes = job
+            
+            start = monotonic()
+            self.lock.acquire()
+            try:
+                self._running[macro] = start
+            finally:
+                self.lock.release()
+            timer = self._timers.schedule(macro.budget, self._check_overrun,
+                                          macro, start)
+            try:
+                self._run(macro, changes)
+            except Exception:
+                _log.exception("Macro '%s' failed", macro.name)
+            finally:
+                timer.cancel()
+                
+            elapsed = monotonic() - start
+            if elapsed > macro.budget:
+                self._report(macro, elapsed, True)
+                
+            self.lock.acquire()
+            try:
+                del self._running[macro]
+                busy = self._busy[macro]
+                if busy[0]:
+                    self._busy[macro] = [False, []]
+                    self._queue.put((macro, busy[1]))
+                else:
+                    del self._busy[macro]
+            finally:
+                self.lock.release()
+                
+                
+    def _watch(self):
+        """ Run the budget timers until the pool is stopped """
+        while self._watching:
+            deadline = self._timers.next_deadline()
+            if deadline is None:
+                self._wakeup.wait()
+            else:
+                self._wakeup.wait(max(0., deadline - monotonic()))
+            self._timers.run_due()
+            
+            
+    def _check_overrun(self, macro, start):
+        """ Report a macro that is still on the run started at start """
+        if self._running.get(macro) == start:
+            self._report(macro, monotonic() - start, False)
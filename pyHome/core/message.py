@@ -30,12 +30,29 @@ class Message(object):
     This general message class is essentially a list of bytes, with several 
     protocol-specific methods implemented on it when one of its subclasses is
     created.
+    
+    Messages are created for every byte string sent or received, so they are
+    kept small: the bytes are stored in a bytearray and the attributes are
+    slots. Subclasses must declare __slots__ for any attributes they add.
+    A message made from a byte string keeps it, so sending it again does
+    not need to convert its bytes.
     """
+    __slots__ = ('_data', '_raw', 'source', 'timing')
+    
     def __init__(self, data=None):
         if data is None:
-            self._data = []
+            self._data = bytearray()
         else:
-            self._data = data
+            self._data = bytearray(data)
+            
+        #: Byte string of _data, set until the message is changed
+        self._raw = data if isinstance(data, str) else None
+            
+        #: Port of the PLM a received message came from
+        self.source = None
+        
+        #: :class:`CommandTiming` of an outgoing message, if it is timed
+        self.timing = None
 
 
     def __str__(self):
@@ -44,26 +61,52 @@ class Message(object):
 
     def clear(self):
         """ Clears the data list in the message. """
-        self._data = []
+        del self._data[:]
+        self._raw = None
 
     def add_byte(self, newbyte):
         """ Adds a new byte to the end of the byte list. """
         self._data.append(newbyte)
+        self._raw = None
+        
+    def extend(self, newbytes):
+        """ Adds a sequence of bytes (as ints) to the end of the byte list. """
+        self._data.extend(newbytes)
+        self._raw = None
         
     def matches(self, other):
         """
-        Checks if two messages match. This is not the same as __eq__ since this
-        allows wildcards (a -1 is a byte wildcard). The messages must still be
-        the same length.
+        Checks if a message matches another message or a list of bytes. This
+        is not the same as __eq__ since this allows wildcards (a -1 is a byte
+        wildcard, which can only be given in a list). The messages must still
+        be the same length.
+        """
+        pattern = other._data if isinstance(other, Message) else other
+        return ( all([i==j or i<0 or j<0 for i, j in zip(self._data, pattern)])
+                 and len(self._data) == len(pattern) )
+        
+    def command_name(self):
+        """
+        Get a short name for the command an outgoing message carries, used to
+        group latency statistics. The base class returns None.
+        """
+        return None
+        
+    def coalesce_key(self):
+        """
+        Get a key identifying what this message does, so that a newer message
+        with the same key can replace this one in the send queue if it has not
+        been sent yet. The base class returns None, which never coalesces.
         """
-        return ( all([i==j or i<0 or j<0 for i, j in zip(self._data, other._data)])
-                 and len(self._data) == len(other._data) )
+        return None
         
     def get_byte_string(self):
         """
         Get the message data in raw byte string format, for serial.write()
         """
-        return "".join(['%02X' % i for i in self._data]).decode('hex')
+        if self._raw is None:
+            self._raw = bytes(self._data)
+        return self._raw
         
 
     def is_complete(self):
@@ -25,7 +25,6 @@ SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
 import xml.etree.ElementTree as ET
 
-from datetime import datetime
 from device import Device
 
 class MotionSensor(Device):
@@ -40,7 +39,7 @@ class MotionSensor(Device):
     
     def __init__(self, house, xml):
         Device.__init__(self, house, xml)
-        self.last_motion_time = None
+        self._timer = None  # Timeout while Waiting
         
         try:
             self.off_time = float(xml.find("timeout").text)
@@ -64,27 +63,32 @@ class MotionSensor(Device):
              and new_state[0] == 'On':
                              
             ns = (new_state[0], self.off_time)
-            self.last_motion_time = None
+            self._cancel_timer()
             Device.set_state(self, ns)
             
         elif self.state[0] == 'On' and new_state[0] == 'Off':
             ns = ('Waiting', self.off_time)
-            self.last_motion_time = datetime.now()
+            self._cancel_timer()
+            self._timer = self.house.timers.schedule(self.off_time, self._expire)
             Device.set_state(self, ns)
 
     
     def state_str(self):
+        if self.state[0] == 'Waiting' and self._timer is not None:
+            return '%s (%3.0f s)' % (self.state[0], self._timer.remaining())
         return '%s (%3.0f s)' % self.state
         
-    def update(self):
-        if self.state[0] == 'Waiting' and self.last_motion_time is not None:
-            elapsed = datetime.now() - self.last_motion_time
-            remaining = self.off_time - elapsed.total_seconds()
-            if remaining > 0.:
-                self.state = ('Waiting', remaining)
-            else:
-                self.state = ('Off', 0.)
-                self.last_motion_time = None
+        
+    def _expire(self):
+        """ Called by the house timers when the timeout runs out """
+        self._timer = None
+        Device.set_state(self, ('Off', 0.))
+        
+        
+    def _cancel_timer(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
     
     
     def activity(self):
@@ -96,7 +100,7 @@ class MotionSensor(Device):
         Artificially trigger motion, mainly for debugging purposes
         """
         if self.state[0] == 'Off':
-            self.state = ('On', self.off_time)
+            Device.set_state(self, ('On', self.off_time))
             
     
     def save(self):
@@ -111,6 +115,7 @@ class MotionSensor(Device):
                 self.xml.find("pos").text = " ".join([str(x) for x in self.pos])
             self.xml.find("icon").text = self.icon
             self.xml.find("timeout").text = str(self.off_time)
+            self._save_plm()
             
             self.house.save_devices()
         finally:
@@ -26,45 +26,223 @@ SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 import threading
 import serial
 import time
-import Queue
+import os
+import errno
+import select
 
+from sendqueue import SendQueue
+from capture import CaptureWriter, RX, TX
+from wakeup import WakeupPipe, PIPE_WAKEUP
+from log import get_logger
+
+_log = get_logger('plm')
 
 class PLM(threading.Thread):
     """
     Provide an interface with the Insteon PLM. This is a dedicated PLM thread
     with a send_queue that other devices can add message to. Received messages
     are processed and passed on according to their type.
+    
+    The send_queue is a :class:`SendQueue`, so a newer command to a device
+    replaces an older one of the same kind that has not been sent yet, and
+    interactive commands are sent ahead of automation and background ones.
+    
+    The thread can run in one of two I/O modes:
+     * *poll* - Check the send queue and serial port every 5 ms
+     * *select* - Block on the serial port and a wakeup pipe that is written
+       to by send(), so messages go out and come in as soon as possible and
+       an idle PLM does not wake up at all. This needs a POSIX platform and
+       serial port.
     """
-    def __init__(self, house, usbport, baud=19200, timeout=0):
+    io_modes = ['poll', 'select']
+    
+    def __init__(self, house, usbport, baud=19200, timeout=0, io_mode='poll'):
         threading.Thread.__init__(self)
-        self.send_queue = Queue.Queue()
+        if io_mode not in self.io_modes:
+            raise ValueError("Unknown PLM I/O mode '%s'" % io_mode)
+        if io_mode == 'select' and not PIPE_WAKEUP:
+            raise ValueError("The 'select' PLM I/O mode needs a POSIX "
+                             "platform, use 'poll'")
+            
+        self.send_queue = SendQueue()
         self.running = True
         self.setDaemon(True)
         self.house = house
+        self.usbport = usbport
+        self.io_mode = io_mode
         self._serialport = serial.Serial(usbport, baud, timeout=timeout)
         
+        # Used to wake the thread from select() when there is work
+        self._wakeup = WakeupPipe() if io_mode == 'select' else None
+        
+        #: Capture of the raw serial traffic, if one is running
+        self.capture = None
+        
+        #: Number of times the thread has woken up to look for work
+        self.wakeups = 0
+        self._start_time = None
+        self._start_cpu = None
+        
+        
+    def send(self, msg, priority=None):
+        """
+        Put a message in the send queue and wake the PLM thread. priority is
+        one of the send queue lanes, or None for the calling thread's lane.
+        """
+        self.send_queue.put(msg, priority)
+        if self._wakeup is not None:
+            self._wakeup.wake()
+        
+        
+    def stop(self):
+        """ Stop the PLM thread """
+        self.running = False
+        if self._wakeup is not None:
+            self._wakeup.wake()
+        
         
     def run(self):
+        self._start_time = time.time()
+        self._start_cpu = sum(os.times()[:2])
+        
+        if self.io_mode == 'select':
+            self._run_select()
+        else:
+            self._run_poll()
+            
+            
+    def start_capture(self, path):
+        """ Start recording all serial traffic to a capture file """
+        self.stop_capture()
+        self.capture = CaptureWriter(path)
+        
+        
+    def stop_capture(self):
+        """ Stop recording serial traffic """
+        capture = self.capture
+        self.capture = None
+        if capture is not None:
+            capture.close()
+            
+            
+    def feed(self, data):
+        """
+        .. warning:: This method is not implemented in the base class.
+        
+        Process a string of received bytes as if it had been read from the
+        serial port, splitting it into messages with the protocol's decoder.
+        This is also used to replay captured traffic.
+        """
+        raise NotImplementedError
+        
+        
+    def get_io_stats(self):
+        """
+        Get the number of thread wakeups and the process CPU time used since
+        the PLM thread started, to compare the I/O modes.
+        """
+        if self._start_time is None:
+            elapsed = cpu = 0.
+        else:
+            elapsed = time.time() - self._start_time
+            cpu = sum(os.times()[:2]) - self._start_cpu
+            
+        return {'Mode': self.io_mode,
+                'Elapsed': elapsed,
+                'Wakeups': self.wakeups,
+                'Wakeups/s': self.wakeups / elapsed if elapsed > 0 else 0.,
+                'CPU': cpu,
+                'CPU %': 100. * cpu / elapsed if elapsed > 0 else 0.}
+            
+            
+    def get_lane_stats(self):
+        """ Get the queue latency statistics for each priority lane """
+        return self.send_queue.get_lane_stats()
+            
+            
+    def _run_poll(self):
+        """ Check for messages to send and receive every 5 ms """
         while self.running:
-            # Send new messages
-            while not self.send_queue.empty():
-                newmsg = self.send_queue.get(False)
-                self._serialport.write( newmsg.get_byte_string() )
+            self.wakeups += 1
+            self._send_queued()
                 
             # Then check for incoming messages at the serial port
             try:
-                while self._serialport.inWaiting() > 0: # Read until there are no more bytes at the port
-                    data = self._serialport.read()      # Read 1 byte from the serial port
-                    self._message.add_byte(ord(data))   # Add it to the current message
-
-                    if self._message.is_complete():     # If the message is complete, process it
-                        self._message.process(self.house)                
-                        self._message.clear()
-            except SerialException:
-                print "Got serial exception"
-                pass
+                self._read_port()
+            except serial.SerialException:
+                _log.exception("Got serial exception")
                 
             # Sleep a little to keep this from using too much of the CPU
             time.sleep(0.005)
             
             
+    def _run_select(self):
+        """ Sleep until the serial port has data or send() is called """
+        port_fd = self._serialport.fileno()
+        
+        while self.running:
+            self._send_queued()
+            
+            try:
+                ready = select.select([port_fd, self._wakeup], [], [],
+                                      self._next_timeout())[0]
+            except select.error as e:
+                if e.args[0] == errno.EINTR:
+                    continue
+                raise
+            
+            self.wakeups += 1
+                
+            if self._wakeup in ready:
+                self._wakeup.drain()
+                
+            if port_fd in ready:
+                try:
+                    self._read_port()
+                except serial.SerialException:
+                    _log.exception("Got serial exception")
+                    
+                    
+    def _send_queued(self):
+        """ Write every message in the send queue to the serial port """
+        while not self.send_queue.empty():
+            newmsg = self.send_queue.get(False)
+            self._write( newmsg.get_byte_string() )
+            
+            
+    def _write(self, data):
+        """ Write a byte string to the serial port """
+        self._serialport.write(data)
+        capture = self.capture
+        if capture is not None:
+            capture.record(TX, data)
+            
+            
+    def _next_timeout(self):
+        """
+        Seconds until _send_queued() needs to run again even if nothing is
+        sent or received, or None to wait indefinitely.
+        """
+        return None
+            
+            
+    def _read_port(self):
+        """
+        Drain every byte waiting at the serial port with a single read and
+        pass it to feed().
+        """
+        waiting = self._serialport.inWaiting()
+        if waiting > 0:
+            data = self._serialport.read(waiting)
+            capture = self.capture
+            if capture is not None:
+                capture.record(RX, data)
+            self.feed(data)
+            
+            
+    def _handle_message(self, frame):
+        """ Process one complete received message (a bytearray) """
+        self._message.source = self.usbport
+        self._message.extend(frame)
+        self._message.process(self.house)
+        self._message.clear()
@@ -0,0 +1,149 @@
+"""
+Copyright (c) 2012, Tyler Voskuilen
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met: 
+
+1. Redistributions of source code must retain the above copyright notice, this
+   list of conditions and the following disclaimer. 
+2. Redistributions in binary form must reproduce the above copyright notice,
+   this list of conditions and the following disclaimer in the documentation
+   and/or other materials provided with the distribution. 
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR
+ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+(INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+(INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+
+import threading
+
+from clock import monotonic
+from stats import RollingStats
+from log import get_logger
+
+_log = get_logger('house')
+
+
+class TickProfiler(object):
+    """
+    Times each pass (tick) of the house main loop. The loop calls 
+    :meth:`begin` at the top of each tick and :meth:`mark` after each phase,
+    which records the time since the previous mark under that phase name.
+    :meth:`end` records the total time awake, *Busy*, which is every phase 
+    but *Sleep*.
+    
+    Other measurements, like the event queue depth or the run time of each
+    macro (which can come from other threads), are added with :meth:`add`
+    and :meth:`add_macro`. Everything is kept as :class:`RollingStats`.
+    
+    If summary_interval is set, :meth:`start_summaries` schedules a timer
+    that writes a summary of every measurement to the log every
+    summary_interval seconds, even while the loop is idle.
+    """
+    def __init__(self, size=1000, summary_interval=None):
+        self.lock = threading.Lock()
+        self.size = size
+        self.summary_interval = summary_interval
+        self._stats = {}
+        self._macros = {}
+        self._start = None
+        self._mark = None
+        self._sleep = 0.
+        
+        
+    def begin(self):
+        """ Start timing a tick """
+        self._start = self._mark = monotonic()
+        self._sleep = 0.
+        
+        
+    def mark(self, phase):
+        """ Record the time since the last mark as phase """
+        now = monotonic()
+        elapsed = now - self._mark
+        self._mark = now
+        if phase == 'Sleep':
+            self._sleep += elapsed
+        self.add(phase, elapsed)
+        
+        
+    def end(self):
+        """ Finish timing a tick """
+        self.add('Busy', monotonic() - self._start - self._sleep)
+        
+        
+    def start_summaries(self, timers):
+        """
+        Log a summary every summary_interval seconds with a timer on timers
+        (a :class:`TimerService`). Does nothing if summary_interval is None.
+        """
+        if self.summary_interval is not None:
+            timers.schedule(self.summary_interval, self._timed_summary, timers)
+            
+            
+    def _timed_summary(self, timers):
+        """ Log a summary and schedule the next one """
+        self.log_summary()
+        self.start_summaries(timers)
+        
+        
+    def add(self, name, value):
+        """ Add a sample of a measurement """
+        self.lock.acquire()
+        try:
+            if name not in self._stats:
+                self._stats[name] = RollingStats(self.size)
+            self._stats[name].add(value)
+        finally:
+            self.lock.release()
+            
+            
+    def add_macro(self, name, elapsed):
+        """ Add the run time of a macro """
+        self.lock.acquire()
+        try:
+            if name not in self._macros:
+                self._macros[name] = RollingStats(self.size)
+            self._macros[name].add(elapsed)
+        finally:
+            self.lock.release()
+            
+            
+    def get_stats(self):
+        """
+        Get the summary (count, mean, p50, p95, p99 and max) of each
+        measurement, with the macros under 'Macro runs'. Times are in seconds.
+        """
+        self.lock.acquire()
+        try:
+            stats = dict((k, v.summary()) for k, v in self._stats.iteritems())
+            stats['Macro runs'] = dict((k, v.summary()) 
+                                   for k, v in self._macros.iteritems())
+        finally:
+            self.lock.release()
+        return stats
+        
+        
+    def log_summary(self):
+        """ Write the p50, p95, p99 and max of every measurement to the log """
+        stats = self.get_stats()
+        macros = stats.pop('Macro runs')
+        rows = sorted(stats.items()) + \
+               sorted(('Macro ' + k, v) for k, v in macros.iteritems())
+        _log.info("Main loop profile (up to %d recent samples each):", 
+                  self.size)
+        for name, s in rows:
+            if s['Count'] == 0:
+                continue
+            scale, unit = (1., '') if name == 'Queue depth' else (1e3, ' ms')
+            _log.info("  %-24s p50 %8.2f  p95 %8.2f  p99 %8.2f  max %8.2f%s",
+                      name, scale * s['p50'], scale * s['p95'], 
+                      scale * s['p99'], scale * s['Max'], unit)
@@ -0,0 +1,137 @@
+"""
+Copyright (c) 2012, Tyler Voskuilen
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met: 
+
+1. Redistributions of source code must retain the above copyright notice, this
+   list of conditions and the following disclaimer. 
+2. Redistributions in binary form must reproduce the above copyright notice,
+   this list of conditions and the following disclaimer in the documentation
+   and/or other materials provided with the distribution. 
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR
+ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+(INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+(INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+
+
+class RingBuffer(object):
+    """
+    A reusable circular byte buffer for serial receive data.
+
+    Bytes read from the port are written in bulk and frames are consumed from
+    the front, so nothing is reallocated while traffic is flowing. Indexing is
+    relative to the oldest unread byte. If a write would overflow the buffer,
+    its capacity is doubled rather than dropping data.
+    """
+    def __init__(self, capacity=1024):
+        self._buf = bytearray(capacity)
+        self._head = 0   # Index of the oldest unread byte
+        self._size = 0   # Number of unread bytes
+
+
+    def __len__(self):
+        return self._size
+
+
+    def __getitem__(self, i):
+        """ Get the i'th unread byte as an int """
+        if i < 0 or i >= self._size:
+            raise IndexError("RingBuffer index out of range")
+        return self._buf[(self._head + i) % len(self._buf)]
+
+
+    def write(self, data):
+        """ Append a string or bytearray of new bytes to the buffer """
+        n = len(data)
+        if n == 0:
+            return
+        if self._size + n > len(self._buf):
+            self._grow(self._size + n)
+
+        cap = len(self._buf)
+        tail = (self._head + self._size) % cap
+        first = min(n, cap - tail)
+        self._buf[tail:tail+first] = data[:first]
+        if first < n:
+            self._buf[0:n-first] = data[first:]
+        self._size += n
+
+
+    def peek(self, n):
+        """ Get the first n unread bytes as a bytearray without consuming """
+        n = min(n, self._size)
+        cap = len(self._buf)
+        end = self._head + n
+        if end <= cap:
+            return self._buf[self._head:end]
+        return self._buf[self._head:] + self._buf[:end-cap]
+
+
+    def find(self, byte, start=0):
+        """
+        Get the index of the first unread byte equal to byte (a one character
+        string) at or after start, or -1 if there is none. The search runs in
+        C on each contiguous part of the buffer.
+        """
+        if start >= self._size:
+            return -1
+        cap = len(self._buf)
+        end = self._head + self._size
+        
+        # The unread bytes are _buf[head:end], wrapped past the end of _buf
+        if end <= cap:
+            i = self._buf.find(byte, self._head + start, end)
+            return -1 if i < 0 else i - self._head
+            
+        first = cap - self._head
+        if start < first:
+            i = self._buf.find(byte, self._head + start, cap)
+            if i >= 0:
+                return i - self._head
+            start = first
+        i = self._buf.find(byte, start - first, end - cap)
+        return -1 if i < 0 else i + first
+
+
+    def read(self, n):
+        """ Consume and return the first n unread bytes as a bytearray """
+        data = self.peek(n)
+        self.skip(len(data))
+        return data
+
+
+    def skip(self, n):
+        """ Discard the first n unread bytes """
+        n = min(n, self._size)
+        self._size -= n
+        if self._size == 0:
+            self._head = 0
+        else:
+            self._head = (self._head + n) % len(self._buf)
+
+
+    def clear(self):
+        """ Discard all unread bytes """
+        self._head = 0
+        self._size = 0
+
+
+    def _grow(self, needed):
+        """ Reallocate to at least 'needed' bytes, unwrapping the contents """
+        cap = len(self._buf)
+        while cap < needed:
+            cap *= 2
+        data = self.peek(self._size)
+        self._buf = bytearray(cap)
+        self._buf[0:len(data)] = data
+        self._head = 0
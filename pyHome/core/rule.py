@@ -25,6 +25,10 @@ SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
 import time
 
+from log import get_logger
+
+_log = get_logger('macro')
+
 
 class Rule(object):
     """
@@ -82,7 +86,8 @@ class Rule(object):
             else:
                 self.device = self.house
         except IndexError:
-            print "Error: Rule could not find an implementer", self._room, self._device
+            _log.error("Rule could not find an implementer %s %s", 
+                       self._room, self._device)
             self.device = None
 
 
@@ -0,0 +1,222 @@
+"""
+Copyright (c) 2012, Tyler Voskuilen
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met: 
+
+1. Redistributions of source code must retain the above copyright notice, this
+   list of conditions and the following disclaimer. 
+2. Redistributions in binary form must reproduce the above copyright notice,
+   this list of conditions and the following disclaimer in the documentation
+   and/or other materials provided with the distribution. 
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR
+ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+(INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+(INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+
+import collections
+import threading
+import time
+import Queue
+
+from clock import monotonic
+from stats import RollingStats
+
+#: Priority lanes, highest first. GUI clicks and client commands are
+#: interactive, macros are automation, and periodic upkeep is background.
+INTERACTIVE = 'Interactive'
+AUTOMATION = 'Automation'
+BACKGROUND = 'Background'
+LANES = (INTERACTIVE, AUTOMATION, BACKGROUND)
+
+
+class SendQueue(object):
+    """
+    A queue of outgoing messages with priority lanes and command coalescing.
+    
+    Messages are taken from the highest priority lane that has any, except
+    that a lower lane whose oldest message has waited longer than its
+    max_wait is served first, so bulk traffic is delayed but never starved.
+    
+    If a message is put while an older message with the same coalesce_key()
+    is still waiting, the newer message replaces the older one. It keeps its
+    place in line, or moves up if it was put in a higher lane. Either way it
+    keeps the put time of the message it replaced, so a command that keeps
+    being updated still becomes overdue and its wait is counted in full.
+    Messages with a coalesce_key() of None are never coalesced.
+    
+    The time each message waits in the queue is kept for each lane, along
+    with how many waited longer than the lane's target latency.
+    
+    This has the same put/get/empty/qsize interface as Queue.Queue.
+    """
+    def __init__(self, max_wait=None, target_latency=None):
+        self.lock = threading.Lock()
+        self._not_empty = threading.Condition(self.lock)
+        self._lanes = dict((lane, collections.deque()) for lane in LANES)
+        self._pending = {}   # key -> [key, message, lane, put time] entry
+        self._size = 0
+        self._local = threading.local()
+        
+        #: Longest time in seconds the oldest message in a lane waits before
+        #: it is sent ahead of higher lanes (None waits indefinitely)
+        self.max_wait = {INTERACTIVE: None, AUTOMATION: 2., BACKGROUND: 10.}
+        if max_wait is not None:
+            self.max_wait.update(max_wait)
+            
+        #: Target time in seconds for messages to leave each lane
+        self.target_latency = {INTERACTIVE: 0.5, AUTOMATION: 2., 
+                               BACKGROUND: None}
+        if target_latency is not None:
+            self.target_latency.update(target_latency)
+            
+        self.latency = dict((lane, RollingStats()) for lane in LANES)
+        self.over_target = dict((lane, 0) for lane in LANES)
+        
+        #: Total number of messages that were replaced by a newer one
+        self.coalesced = 0
+        
+        #: Number of replaced messages for each device address
+        self.coalesced_by_device = collections.Counter()
+        
+        
+    def set_thread_priority(self, lane):
+        """ Set the lane for messages put by the calling thread """
+        if lane not in LANES:
+            raise ValueError("Unknown priority lane '%s'" % lane)
+        self._local.lane = lane
+        
+        
+    def put(self, msg, priority=None):
+        """
+        Add a message to a priority lane, replacing a pending message with the
+        same key. If no priority is given, the calling thread's lane from
+        set_thread_priority() is used, or INTERACTIVE if it has none.
+        """
+        if priority is None:
+            priority = getattr(self._local, 'lane', INTERACTIVE)
+        if priority not in LANES:
+            raise ValueError("Unknown priority lane '%s'" % priority)
+            
+        key = msg.coalesce_key()
+        self.lock.acquire()
+        try:
+            put_time = monotonic()
+            entry = self._pending.get(key) if key is not None else None
+            if entry is not None:
+                self.coalesced += 1
+                self.coalesced_by_device[key[0]] += 1
+                put_time = entry[3]
+                
+                if LANES.index(priority) < LANES.index(entry[2]):
+                    entry[1] = None     # Dead entry, skipped by get()
+                    self._size -= 1
+                    entry = None
+                else:
+                    entry[1] = msg
+                    
+            if entry is None:
+                entry = [key, msg, priority, put_time]
+                self._lanes[priority].append(entry)
+                self._size += 1
+                if key is not None:
+                    self._pending[key] = entry
+                self._not_empty.notify()
+        finally:
+            self.lock.release()
+            
+            
+    def get(self, block=True, timeout=None):
+        """ Remove and return the next message, like Queue.get() """
+        self.lock.acquire()
+        try:
+            if timeout is not None:
+                endtime = time.time() + timeout
+                
+            while not self._size:
+                if not block:
+                    raise Queue.Empty
+                elif timeout is None:
+                    self._not_empty.wait()
+                else:
+                    remaining = endtime - time.time()
+                    if remaining <= 0.:
+                        raise Queue.Empty
+                    self._not_empty.wait(remaining)
+                    
+            return self._pop()
+        finally:
+            self.lock.release()
+            
+            
+    def empty(self):
+        return not self._size
+        
+        
+    def qsize(self):
+        return self._size
+        
+        
+    def get_lane_stats(self):
+        """
+        Get the number of waiting messages and the queue latency percentiles
+        (in seconds) for each lane
+        """
+        stats = {}
+        self.lock.acquire()
+        try:
+            for lane in LANES:
+                stats[lane] = self.latency[lane].summary()
+                stats[lane]['Pending'] = len([e for e in self._lanes[lane]
+                                              if e[1] is not None])
+                stats[lane]['Target'] = self.target_latency[lane]
+                stats[lane]['Over target'] = self.over_target[lane]
+        finally:
+            self.lock.release()
+        return stats
+        
+        
+    def _pop(self):
+        """ Take the next live entry. Must be called with the lock held. """
+        for lane in LANES:
+            self._drop_dead(lane)
+            
+        now = monotonic()
+        
+        # Overdue lower lanes first, oldest first, then strict priority
+        overdue = [(self._lanes[lane][0][3], lane) for lane in LANES
+                   if self._lanes[lane] and self.max_wait[lane] is not None
+                   and now - self._lanes[lane][0][3] > self.max_wait[lane]]
+        if overdue:
+            lane = min(overdue)[1]
+        else:
+            lane = [lane for lane in LANES if self._lanes[lane]][0]
+            
+        key, msg, lane, put_time = self._lanes[lane].popleft()
+        if key is not None:
+            del self._pending[key]
+        self._size -= 1
+        
+        waited = now - put_time
+        self.latency[lane].add(waited)
+        target = self.target_latency[lane]
+        if target is not None and waited > target:
+            self.over_target[lane] += 1
+            
+        return msg
+        
+        
+    def _drop_dead(self, lane):
+        """ Remove replaced entries from the front of a lane """
+        entries = self._lanes[lane]
+        while entries and entries[0][1] is None:
+            entries.popleft()
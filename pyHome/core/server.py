@@ -28,6 +28,10 @@ import Queue
 import socket
 import pickle
 
+from log import get_logger
+
+_log = get_logger('house')
+
 ###############################################################################
 # server communication interface
 class TCPServer(threading.Thread):
@@ -67,7 +71,7 @@ class TCPServer(threading.Thread):
             #print "Got connection from", addr
             data_str = conn.recv(1024)
             data = pickle.loads(data_str)
-            print "Received Command from ", addr
+            _log.info("Received command from %s", addr)
             #print "command", data_str
             result = self.CallDeviceFunction(data)
             if result is not None:
@@ -0,0 +1,81 @@
+"""
+Copyright (c) 2012, Tyler Voskuilen
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met: 
+
+1. Redistributions of source code must retain the above copyright notice, this
+   list of conditions and the following disclaimer. 
+2. Redistributions in binary form must reproduce the above copyright notice,
+   this list of conditions and the following disclaimer in the documentation
+   and/or other materials provided with the distribution. 
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR
+ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+(INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+(INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+
+import bisect
+import collections
+
+
+class RollingStats(object):
+    """
+    Keeps the most recent samples of a measurement (for example a latency in
+    seconds) and reports percentiles over them. The total count and maximum
+    cover every sample ever added.
+    """
+    def __init__(self, size=1000):
+        self._samples = collections.deque(maxlen=size)
+        self.count = 0
+        self.max = None
+        
+        
+    def add(self, value):
+        """ Add a sample """
+        self._samples.append(value)
+        self.count += 1
+        if self.max is None or value > self.max:
+            self.max = value
+            
+            
+    def percentile(self, p, samples=None):
+        """ Get the p'th percentile (0-100) of the recent samples """
+        if samples is None:
+            samples = sorted(self._samples)
+        if not samples:
+            return None
+        i = int(round(p / 100. * (len(samples) - 1)))
+        return samples[i]
+        
+        
+    def summary(self):
+        """ Get the count, mean, p50, p95, p99 and max of the samples """
+        samples = sorted(self._samples)
+        mean = sum(samples) / len(samples) if samples else None
+        return {'Count': self.count,
+                'Mean': mean,
+                'p50': self.percentile(50, samples),
+                'p95': self.percentile(95, samples),
+                'p99': self.percentile(99, samples),
+                'Max': self.max}
+                
+                
+    def histogram(self, edges):
+        """
+        Count the recent samples between each pair of sorted bin edges. The
+        first count is for samples below edges[0] and the last is for
+        samples at or above edges[-1].
+        """
+        counts = [0] * (len(edges) + 1)
+        for value in self._samples:
+            counts[bisect.bisect_right(edges, value)] += 1
+        return counts
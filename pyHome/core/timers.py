@@ -0,0 +1,149 @@
+"""
+Copyright (c) 2012, Tyler Voskuilen
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met: 
+
+1. Redistributions of source code must retain the above copyright notice, this
+   list of conditions and the following disclaimer. 
+2. Redistributions in binary form must reproduce the above copyright notice,
+   this list of conditions and the following disclaimer in the documentation
+   and/or other materials provided with the distribution. 
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR
+ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+(INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+(INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+
+import heapq
+import itertools
+import threading
+
+from clock import monotonic
+
+
+class Timer(object):
+    """ A callback scheduled on a :class:`TimerService` """
+    __slots__ = ('when', 'callback', 'args', 'cancelled', '_service')
+    
+    def __init__(self, service, when, callback, args):
+        self._service = service
+        self.when = when          # Monotonic time when it fires
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+        
+    def cancel(self):
+        """ Stop the timer from firing. Does nothing if it already fired. """
+        self._service.cancel(self)
+        
+    def remaining(self):
+        """ Seconds until the timer fires """
+        return max(0., self.when - monotonic())
+        
+        
+class TimerService(object):
+    """
+    One-shot timers kept in a heap ordered by their monotonic deadline.
+    
+    The owner calls :meth:`run_due` from its own thread whenever it wakes up,
+    and waits no longer than :meth:`next_deadline`, so the cost is only paid
+    when a timer is scheduled, cancelled or fires, however many timers are
+    waiting. Cancelled timers stay in the heap until they reach the front,
+    or until they are more than half of it.
+    
+    If *wake* is given, it is called when a timer is scheduled ahead of all
+    the others, so the owner can shorten its wait.
+    """
+    def __init__(self, wake=None):
+        self.lock = threading.Lock()
+        self._wake = wake
+        self._heap = []
+        self._counter = itertools.count()  # Keeps equal deadlines in order
+        self._cancelled = 0
+        
+        
+    def __len__(self):
+        return len(self._heap) - self._cancelled
+        
+        
+    def schedule(self, delay, callback, *args):
+        """ Call callback(*args) in delay seconds. Returns the :class:`Timer`. """
+        timer = Timer(self, monotonic() + delay, callback, args)
+        self.lock.acquire()
+        try:
+            heapq.heappush(self._heap, (timer.when, next(self._counter), timer))
+            first = self._heap[0][2] is timer
+        finally:
+            self.lock.release()
+            
+        if first and self._wake is not None:
+            self._wake()
+        return timer
+        
+        
+    def cancel(self, timer):
+        """ Cancel a timer """
+        self.lock.acquire()
+        try:
+            if timer.cancelled or timer.callback is None:
+                return
+            timer.cancelled = True
+            timer.callback = timer.args = None
+            self._cancelled += 1
+            if self._cancelled > 64 and self._cancelled * 2 > len(self._heap):
+                self._heap = [e for e in self._heap if not e[2].cancelled]
+                heapq.heapify(self._heap)
+                self._cancelled = 0
+        finally:
+            self.lock.release()
+            
+            
+    def next_deadline(self):
+        """ Monotonic time of the next timer, or None if there are none """
+        self.lock.acquire()
+        try:
+            self._pop_cancelled()
+            return self._heap[0][0] if self._heap else None
+        finally:
+            self.lock.release()
+            
+            
+    def run_due(self, now=None):
+        """
+        Call every timer whose deadline has passed, in deadline order.
+        Returns the number of timers called.
+        """
+        if now is None:
+            now = monotonic()
+        count = 0
+        while True:
+            self.lock.acquire()
+            try:
+                self._pop_cancelled()
+                if not self._heap or self._heap[0][0] > now:
+                    return count
+                timer = heapq.heappop(self._heap)[2]
+                callback, args = timer.callback, timer.args
+                timer.callback = timer.args = None # Fired, so cancel() is a no-op
+            finally:
+                self.lock.release()
+                
+            # Call outside the lock so callbacks can schedule new timers
+            callback(*args)
+            count += 1
+            
+            
+    def _pop_cancelled(self):
+        """ Drop cancelled timers from the front of the heap (locked) """
+        while self._heap and self._heap[0][2].cancelled:
+            heapq.heappop(self._heap)
+            self._cancelled -= 1
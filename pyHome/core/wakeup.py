@@ -0,0 +1,160 @@
+"""
+Copyright (c) 2012, Tyler Voskuilen
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met: 
+
+1. Redistributions of source code must retain the above copyright notice, this
+   list of conditions and the following disclaimer. 
+2. Redistributions in binary form must reproduce the above copyright notice,
+   this list of conditions and the following disclaimer in the documentation
+   and/or other materials provided with the distribution. 
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR
+ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+(INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+(INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+
+import os
+import errno
+import select
+import threading
+
+# fcntl is POSIX only, and so is select() on a pipe
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+from clock import monotonic
+
+#: True if :class:`WakeupPipe` works on this platform
+PIPE_WAKEUP = fcntl is not None
+
+
+class WakeupPipe(object):
+    """
+    A pipe that lets any thread wake a thread that is blocked in select().
+    
+    :meth:`wake` writes a byte to the pipe, and the waiting thread either
+    calls :meth:`wait` or puts the pipe in its own select() call (it has a
+    fileno()) and calls :meth:`drain` when it is ready. Both ends are 
+    non-blocking, so wake() never blocks and many wakes before the waiter
+    runs only wake it once. This needs a POSIX platform (see 
+    :data:`PIPE_WAKEUP`).
+    """
+    def __init__(self):
+        if not PIPE_WAKEUP:
+            raise OSError("A wakeup pipe needs a POSIX platform")
+        self._r, self._w = os.pipe()
+        for fd in (self._r, self._w):
+            fcntl.fcntl(fd, fcntl.F_SETFL, 
+                        fcntl.fcntl(fd, fcntl.F_GETFL) | os.O_NONBLOCK)
+        
+        
+    def fileno(self):
+        """ The read end of the pipe, for select() """
+        return self._r
+        
+        
+    def wake(self):
+        """ Wake the waiting thread, or make its next wait return at once """
+        try:
+            os.write(self._w, 'x')
+        except OSError as e:
+            if e.errno != errno.EAGAIN: # A full pipe will wake it up anyway
+                raise
+                
+                
+    def wait(self, timeout=None):
+        """
+        Wait until wake() is called or timeout seconds pass (forever if 
+        timeout is None). Returns True if it was woken.
+        """
+        deadline = None if timeout is None else monotonic() + timeout
+        while True:
+            if deadline is not None:
+                timeout = max(0., deadline - monotonic())
+            try:
+                ready = select.select([self._r], [], [], timeout)[0]
+            except select.error as e:
+                if e.args[0] == errno.EINTR:
+                    continue
+                raise
+            if ready:
+                self.drain()
+            return bool(ready)
+            
+            
+    def drain(self):
+        """ Empty the pipe after select() found it readable """
+        try:
+            while os.read(self._r, 4096):
+                pass
+        except OSError as e:
+            if e.errno != errno.EAGAIN:
+                raise
+                
+                
+class WakeupEvent(object):
+    """
+    :class:`WakeupPipe`'s wake() and wait() for platforms where select()
+    cannot wait on a pipe, using a Condition with the same monotonic
+    deadline. In Python 2 a Condition wait with a timeout polls every few ms,
+    so this is only used where there is no pipe.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self._cond = threading.Condition(self.lock)
+        self._woken = False
+        
+        
+    def wake(self):
+        """ Wake the waiting thread, or make its next wait return at once """
+        self.lock.acquire()
+        try:
+            self._woken = True
+            self._cond.notify()
+        finally:
+            self.lock.release()
+            
+            
+    def wait(self, timeout=None):
+        """
+        Wait until wake() is called or timeout seconds pass (forever if 
+        timeout is None). Returns True if it was woken.
+        """
+        deadline = None if timeout is None else monotonic() + timeout
+        self.lock.acquire()
+        try:
+            while not self._woken:
+                if deadline is None:
+                    self._cond.wait()
+                else:
+                    remaining = deadline - monotonic()
+                    if remaining <= 0.:
+                        break
+                    self._cond.wait(remaining)
+            woken = self._woken
+            self._woken = False
+            return woken
+        finally:
+            self.lock.release()
+            
+            
+def make_wakeup():
+    """
+    Get a :class:`WakeupPipe` where it works, otherwise a 
+    :class:`WakeupEvent`. Both have wake() and wait().
+    """
+    if PIPE_WAKEUP:
+        return WakeupPipe()
+    return WakeupEvent()
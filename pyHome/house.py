@@ -23,18 +23,37 @@ ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
 SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 """
 
-import Queue
 import time
 import threading
 import os
 import sys
 import re
+import collections
 import xml.etree.ElementTree as ET
 
 
-import GUI
 import Insteon
+from Insteon.event import address_to_int, format_address
 from core.macro import Macro
+from core.eventqueue import EventQueue
+from core.timers import TimerService
+from core.bus import StateBus
+from core.macropool import MacroPool
+from core.profiler import TickProfiler
+from core.clock import monotonic
+from core.sendqueue import AUTOMATION
+from core.latency import LatencyTracker
+from core.log import get_logger
+
+_log = get_logger('house')
+
+
+#: An immutable view of the house devices: a tuple of all the devices, a dict
+#: of room names to tuples of their devices, and a dict of device tags to 
+#: devices. The house replaces it with a new one, with the next generation
+#: number, whenever devices are added, removed or edited.
+DeviceSnapshot = collections.namedtuple('DeviceSnapshot', 
+                                        'generation devices rooms tags')
 
 
 ###############################################################################
@@ -46,12 +65,22 @@ class House(object):
     
     :param PLM: A PLM derived from :class:`threading.Thread()`
     :param server: A server class
-    :param GUI: An observer GUI class derived from :class:`threading.Thread()`
+    :param GUI: An observer GUI class derived from :class:`threading.Thread()`,
+                or None when the house runs headless
      
     """
-    def __init__(self, usbport=None):
+    def __init__(self, usbport=None, io_mode='poll', headless=False):
         """
-        Initialize the house with the USB port it should look for the PLM on.
+        Initialize the house with the USB port it should look for the PLM on,
+        or a list of ports if it has several PLMs. Each PLM runs its own 
+        thread and commands to a device are sent through the PLM set for it
+        in devices.xml (<plm>port</plm>) or the first PLM that hears from it.
+        io_mode sets how the PLM threads wait for serial I/O ('poll' or 
+        'select', see :class:`pyHome.core.PLM`).
+        
+        If headless is True the house runs without the GUI, and without
+        importing wx. The house log then only goes to the 'house' logger
+        (see :mod:`pyHome.core.log`).
         """
         self.lock = threading.Lock()
         
@@ -84,8 +113,21 @@ class House(object):
         self.devTree = ET.parse(self.devFile)
         self.devRoot = self.devTree.getroot()
                 
+        self.event_queue = EventQueue()
+        
+        # Timers run by the main loop, like sensor timeouts
+        self.timers = TimerService(wake=self.event_queue.wake)
+        
+        # Device state changes, delivered once per main loop cycle
+        self.bus = StateBus(wake=self.event_queue.wake)
+        self.changes = []   # The changes delivered in this cycle
+        
         self.devices = {}
         
+        # Devices by address (as an int, see address_to_int) for dispatching
+        # received events
+        self._by_address = {}
+        
         for d in self.devRoot.findall("device"):
             room = d.get("room")
             if room not in self.devices:
@@ -93,7 +135,10 @@ class House(object):
 				
             self.devices[room][d.get("name")] = \
                 self.deviceTypes[d.get("type")](self, d)
+            self._register(self.devices[room][d.get("name")])
 
+        self.snapshot = DeviceSnapshot(0, (), {}, {})
+        self._rebuild_snapshot()
 
         self.macros = {}
         
@@ -106,17 +151,41 @@ class House(object):
         
         
         # Set up other objects
-        self.PLM = Insteon.PLM(self, usbport)
+        self.latency = LatencyTracker()
+        
+        if usbport is None or isinstance(usbport, basestring):
+            usbport = [usbport]
+        self.PLMs = [Insteon.PLM(self, port, io_mode=io_mode) 
+                     for port in usbport]
+        self.PLM = self.PLMs[0]   # Default PLM
+        
+        # Macros run on worker threads, so they never hold up the main loop
+        self.macro_pool = MacroPool(self._exec_macro, self._macro_overrun,
+                                    init=self._automation_lane)
            
-        self.GUI = GUI.Thread(self)
-        self.logger = self.GUI.log_event
+        if headless:
+            self.GUI = None
+            self.logger = _log.info
+        else:
+            import GUI
+            self.GUI = GUI.Thread(self)
+            self.logger = self.GUI.log_event
  
         self.server = None #no server for now
         
         if self.server is not None:
             self.server.house = self
             
-        self.event_queue = Queue.Queue()
+        #: Number of times the main loop has woken up
+        self.wakeups = 0
+        
+        # Main loop timing. Set profiler.summary_interval before activate()
+        # to log it periodically.
+        self.profiler = TickProfiler()
+        
+        # Event dispatch counters, see get_dispatch_stats()
+        self.dispatch_stats = dict.fromkeys(('Batches', 'Events', 'Applied',
+                                             'Folded', 'Largest batch'), 0)
 
         
     def get_icons(self, typeName):
@@ -190,99 +259,262 @@ class House(object):
         command from a client or GUI, or a local Ctrl+C.
 
         """
-        # Start the PLM and server threads
-        self.PLM.start()
-        self.GUI.start()
+        # Start the PLM, macro and server threads
+        for plm in self.PLMs:
+            plm.start()
+        self.macro_pool.start()
+        if self.GUI is not None:
+            self.GUI.start()
         
         if self.server is not None:
             self.server.start()
 
         time.sleep(0.5) #give everything time to get started
 
+        self._automation_lane()
+
         self.running = True
 
-        # Start main loop
+        # Start main loop. It sleeps until an event arrives or a timer or
+        # macro is due, then applies the events, fires the timers, delivers
+        # the state changes and submits the macros that are due (all of them
+        # if any device changed) to the macro pool.
         self.start_time = time.time()
+        profiler = self.profiler
+        profiler.start_summaries(self.timers)
         while self.running:
-            #Update device states
-            for dev in self.get_devices():
-                dev.update()
+            self.wakeups += 1
+            profiler.begin()
+            
+            #Fire device timers
+            self.timers.run_due()
+            profiler.mark('Timers')
+            
+            #Deliver state changes
+            self.changes = self.bus.flush()
+            profiler.mark('Bus')
                  
             #Run macros  
-            for name, macro in self.macros.iteritems():
-                if macro.active:
-                    try:
-                        exec(macro.code)
-                    except Exception as e:
-                        self.logger("Macro '%s' raised exception '%s'" % \
-                                    (macro.name, repr(e)))
-                        self.logger("Macro '%s' is now inactive" % macro.name)
-                        macro.register_error(repr(e))
+            self._run_macros(run_all=bool(self.changes))
+            profiler.mark('Macros')
+            
+            # Wait for new messages in the event queue and apply them
+            deadline = self._next_deadline()
+            if deadline is None:
+                self.event_queue.wait()
+            else:
+                self.event_queue.wait(max(0., deadline - monotonic()))
+            profiler.mark('Sleep')
+            
+            self.process_events()
+            profiler.mark('Dispatch')
+            profiler.end()
+            
+            
+    def _automation_lane(self):
+        """
+        Put commands sent by the calling thread (the main loop or a macro
+        worker) in the automation lane, behind interactive commands from the 
+        GUI and server threads
+        """
+        for plm in self.PLMs:
+            plm.send_queue.set_thread_priority(AUTOMATION)
+            
+            
+    def _run_macros(self, run_all=False):
+        """
+        Submit the active macros that are due, or all of them if run_all, to
+        the macro pool with this cycle's state changes
+        """
+        now = monotonic()
+        for name, macro in self.macros.items():
+            if macro.active and (run_all or now >= macro.next_run):
+                macro.next_run = now + macro.interval
+                self.macro_pool.submit(macro, self.changes)
                 
+                
+    def _exec_macro(self, macro, changes):
+        """
+        Run the code of a macro in the scope of the house, with the state
+        changes that triggered it in 'changes'. Called by the macro pool.
+        """
+        if not macro.active:
+            return
+        start = monotonic()
+        try:
+            exec(macro.code, globals(), {'self': self, 'changes': changes})
+        except Exception as e:
+            self.logger("Macro '%s' raised exception '%s'" % \
+                        (macro.name, repr(e)))
+            self.logger("Macro '%s' is now inactive" % macro.name)
+            macro.register_error(repr(e))
+        finally:
+            self.profiler.add_macro(macro.name, monotonic() - start)
+            
+            
+    def _macro_overrun(self, macro, elapsed, finished):
+        """ Report a macro that ran longer than its time budget """
+        if finished:
+            macro.overruns += 1
+            self.logger("Macro '%s' took %.1f s, over its %.1f s budget" % \
+                        (macro.name, elapsed, macro.budget))
+        else:
+            self.logger("Macro '%s' has run for %.1f s, over its %.1f s "
+                        "budget" % (macro.name, elapsed, macro.budget))
+                    
+                    
+    def _next_deadline(self):
+        """
+        Get the monotonic time when the next timer or macro needs the main
+        loop, or None if nothing is scheduled
+        """
+        deadlines = [m.next_run for m in self.macros.values() if m.active]
+        timer = self.timers.next_deadline()
+        if timer is not None:
+            deadlines.append(timer)
+        return min(deadlines) if deadlines else None
+        
+        
 
-            # Check for new messages in the event queue and apply them
-            while not self.event_queue.empty():
-                event = self.event_queue.get(False)
-
-                # Check for kill messages (just the string 'Kill')
-                if event == 'Kill':
-                    self.running = False
-
-                    if self.server is not None:
-                        self.server.running = False
-
-                    if self.PLM is not None:
-                        self.PLM.running = False
+    def process_events(self):
+        """
+        Take every event waiting in the event queue as one batch, fold the
+        redundant state updates for each device, and apply the rest. Returns
+        the number of events taken from the queue.
+        
+        Consecutive direct events from a device with the same state name,
+        like the levels reported while a dimmer ramps, fold into the last 
+        one. Changes of state name (on/off edges) are all applied in order.
+        """
+        self.profiler.add('Queue depth', self.event_queue.qsize())
+        
+        batch = []
+        kill = False
+        while not self.event_queue.empty():
+            event = self.event_queue.get(False)
+            
+            # Check for kill messages (just the string 'Kill')
+            if event == 'Kill':
+                kill = True
+                break
+            batch.append(event)
+            
+        if batch:
+            self._dispatch(batch)
+            
+        if kill:
+            self.running = False
 
-                    break
+            if self.server is not None:
+                self.server.running = False
 
-                # Only try to match direct messages (ignore broadcasts)
-                try:
+            for plm in self.PLMs:
+                plm.stop()
+                
+            self.macro_pool.stop()
+                
+        return len(batch) + kill
+        
+        
+    def _dispatch(self, batch):
+        """ Fold and apply a batch of events """
+        timestamp = getattr(batch[0], 'timestamp', None)
+        if timestamp is not None:
+            self.profiler.add('Oldest event age', time.time() - timestamp)
+        
+        updates = []  # [device, event] state updates to apply, in order
+        last = {}     # Index in updates of the last update of each device
+        folded = 0
+        
+        for event in batch:
+            # Any message teaches which PLM reaches its sender, but only
+            # direct messages change device states (ignore broadcasts)
+            try:
+                match = self._by_address.get(event.sender)
+                if match is None:
                     if event.type == 'Direct':
-                        match = [d for d in self.get_devices() if d.address == event.sender][0]
-                        disp_str = '%s message from %s (%s) of state change to (%s, %s)' % \
-                        (event.type, match.name, ":".join(['%02X' % x for x in event.sender]), \
-                         event.state[0], event.state[1])
-                        self.logger(disp_str)
-                        match.set_state(event.state)
-
-                except (AttributeError, IndexError):
-                    self.logger("Error: Event could not be matched: "+str(event))
-
-
-            # Insteon devices take about 0.3 seconds to respond and change,
-            # so this doesn't need to run at max speed.
-            time.sleep(0.05)
-            
+                        self.logger("Error: Event could not be matched: "+str(event))
+                    continue
+                    
+                if match.plm is None and event.source is not None:
+                    match.learn_plm(event.source)
+                    
+                if event.type == 'Direct':
+                    # A direct ACK finishes the timing of the command
+                    if event.ack:
+                        self.latency.device_ack(match.address)
+                        
+                    idx = last.get(match.tag)
+                    if idx is not None and \
+                            updates[idx][1].state[0] == event.state[0]:
+                        updates[idx][1] = event
+                        folded += 1
+                    else:
+                        last[match.tag] = len(updates)
+                        updates.append([match, event])
+
+            except (AttributeError, IndexError):
+                self.logger("Error: Event could not be matched: "+str(event))
+                
+        for match, event in updates:
+            disp_str = '%s message from %s (%s) of state change to (%s, %s)' % \
+            (event.type, match.name, format_address(event.sender), \
+             event.state[0], event.state[1])
+            self.logger(disp_str)
+            match.set_state(event.state)
             
+        stats = self.dispatch_stats
+        stats['Batches'] += 1
+        stats['Events'] += len(batch)
+        stats['Applied'] += len(updates)
+        stats['Folded'] += folded
+        stats['Largest batch'] = max(stats['Largest batch'], len(batch))
+        
+        
+    def get_dispatch_stats(self):
+        """
+        Get the event dispatch counters: the number of batches taken from
+        the event queue, the events in them, the state updates applied, the
+        updates folded into later ones, and the largest batch.
+        """
+        return dict(self.dispatch_stats)
+        
+        
+    def route(self, device):
+        """ Get the PLM that reaches a device, the default PLM if unknown """
+        for plm in self.PLMs:
+            if plm.usbport == device.plm:
+                return plm
+        return self.PLM
+        
+        
     def get_rooms(self):
         """
         Get the current list of rooms, with 'All Rooms' added in front
         """
-        self.lock.acquire()
-        try:
-            rooms = ['All Rooms']
-            rooms.extend(self.devices.keys())
-        finally:
-            self.lock.release()
+        rooms = ['All Rooms']
+        rooms.extend(self.snapshot.rooms.keys())
         return rooms
         
         
-    def find_device(self, tag=None, roomAndName=None):
+    def find_device(self, tag=None, roomAndName=None, address=None):
         """
-        
+        Find a device by its tag, (room, name), or address (a list of bytes
+        or an int). Returns None if no device has the address.
         """
-        if roomAndName is not None:
+        if address is not None:
+            if not isinstance(address, (int, long)):
+                address = address_to_int(address)
+            return self._by_address.get(address)
+        
+        elif roomAndName is not None:
             try:
                 return self.devices[roomAndName[0]][roomAndName[1]]
             except KeyError:
-                print "Device not found"
+                _log.warning("Device not found: %s", roomAndName)
         
         elif tag is not None:
-            devList = [d for r in self.devices.itervalues()
-                         for d in r.itervalues() if d.tag == tag]
-            
-            return devList[0]
+            return self.snapshot.tags[tag]
     
     
     def find_macro(self, tag):
@@ -294,20 +526,20 @@ class House(object):
                 
     def get_devices(self, room=None):
         """
-        Get a list of devices either in the whole house or a specific room
+        Get a tuple of devices either in the whole house or a specific room.
+        This reads the current :attr:`snapshot` without locking.
         """
-        devs = []
-        self.lock.acquire()
-        try:
-            if room not in self.devices:
-                devs = [d for r in self.devices.itervalues()
-                          for d in r.itervalues()]
-            else:
-                devs = [d for d in self.devices[room].itervalues()]
-        finally:
-            self.lock.release()
-
-        return devs
+        snapshot = self.snapshot
+        return snapshot.rooms.get(room, snapshot.devices)
+        
+        
+    def _rebuild_snapshot(self):
+        """ Replace the device snapshot. Call with the house lock held. """
+        rooms = dict((room, tuple(devs.itervalues())) 
+                     for room, devs in self.devices.iteritems())
+        devices = tuple(d for devs in rooms.itervalues() for d in devs)
+        self.snapshot = DeviceSnapshot(self.snapshot.generation + 1, devices,
+                                       rooms, dict((d.tag, d) for d in devices))
        
        
     def get_macros(self):
@@ -335,8 +567,10 @@ class House(object):
             room = device.room
             self.devRoot.remove(device.xml)
             del self.devices[room][device.name]
+            self._unregister(device)
             if not self.devices[room]:
                 del self.devices[room]
+            self._rebuild_snapshot()
         finally:
             self.lock.release()
         
@@ -360,31 +594,36 @@ class House(object):
     def edit_device(self, tag, inputDict):
         dev = self.find_device(tag=tag)
         
-        if inputDict["Room"] == dev.room and inputDict["Name"] == dev.name:
-            dev.address = inputDict["Address"]
-            dev.icon = inputDict["Icon"]
-            dev.save()
-            
-        else:
-            currentRoom = dev.room
-            currentName = dev.name
-            if inputDict["Room"] not in self.devices:
-                self.devices[inputDict["Room"]] = {}
-                
-            self.devices[inputDict["Room"]][inputDict["Name"]] = \
-                self.devices[currentRoom][currentName]
+        if inputDict["Room"] != dev.room or inputDict["Name"] != dev.name:
+            self.lock.acquire()
+            try:
+                currentRoom = dev.room
+                currentName = dev.name
+                if inputDict["Room"] not in self.devices:
+                    self.devices[inputDict["Room"]] = {}
+                    
+                self.devices[inputDict["Room"]][inputDict["Name"]] = \
+                    self.devices[currentRoom][currentName]
+                    
+                del self.devices[currentRoom][currentName]
                 
-            del self.devices[currentRoom][currentName]
-            
-            if not self.devices[currentRoom]:
-                del self.devices[currentRoom]
+                if not self.devices[currentRoom]:
+                    del self.devices[currentRoom]
+                    
+                dev.name = inputDict["Name"]
+                dev.room = inputDict["Room"]
+            finally:
+                self.lock.release()
                 
-            newdev = self.devices[inputDict["Room"]][inputDict["Name"]]
-            newdev.name = inputDict["Name"]
-            newdev.room = inputDict["Room"]
-            newdev.address = inputDict["Address"]
-            newdev.icon = inputDict["Icon"]
-            newdev.save()
+        self._set_address(dev, inputDict["Address"])
+        dev.icon = inputDict["Icon"]
+        
+        self.lock.acquire()
+        try:
+            self._rebuild_snapshot()
+        finally:
+            self.lock.release()
+        dev.save()
             
             
     def edit_macro(self, tag, inputDict):
@@ -401,7 +640,9 @@ class House(object):
             self.logger("Macro '%s' is now inactive" % mac.name)
             
         mac.active = inputDict["Active"]
+        mac.next_run = 0.
         mac.save()
+        self.event_queue.wake()
             
     
     def add_device(self, name, room, address, type, icon, pos=None):
@@ -410,9 +651,8 @@ class House(object):
         exist, it will be added automatically. The device is first added
         to the XML file, then the Device object is added to self.devices
         """
-        print "Adding device ", name
+        _log.info("Adding device %s", name)
         self.lock.acquire()
-        print "got lock"
         try:
             if room not in self.devices:
                 self.devices[room] = {}
@@ -429,17 +669,40 @@ class House(object):
                     newdevP.text = " ".join([str(x) for x in pos])
                 newdevI = ET.SubElement(newdev, "icon")
                 newdevI.text = icon
-                print "making device object"
                 self.devices[room][name] = self.deviceTypes[type](self, newdev)
+                self._register(self.devices[room][name])
+                self._rebuild_snapshot()
             else:
                 raise ValueError("Duplicate device")
 
         finally:
             self.lock.release()
-        print "saving devices"
         self.save_devices()
         
         
+    def _register(self, device):
+        """ Index a device by its address. Call with the house lock held. """
+        self._by_address[address_to_int(device.address)] = device
+        
+        
+    def _unregister(self, device):
+        """ Remove a device from the address index. Call with the lock held. """
+        key = address_to_int(device.address)
+        if self._by_address.get(key) is device:
+            del self._by_address[key]
+        
+        
+    def _set_address(self, device, address):
+        """ Change the address of a device and re-index it """
+        self.lock.acquire()
+        try:
+            self._unregister(device)
+            device.address = address
+            self._register(device)
+        finally:
+            self.lock.release()
+            
+            
     def add_macro(self, name, desc, code, active):
         """
         Add a new macro
@@ -471,4 +734,5 @@ class House(object):
         finally:
             self.lock.release()
             
+        self.event_queue.wake()
         self.save_macros()
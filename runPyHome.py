@@ -1,11 +1,35 @@
 # pyHome demonstration program
+#
+# Pass --headless to run without the GUI (wx is then never imported), for
+# example on a controller without a screen. The house log then only goes to
+# the console log below.
+
+import argparse
 
 import pyHome
+from pyHome.core import log
+
+parser = argparse.ArgumentParser(description="Run pyHome")
+parser.add_argument('--headless', action='store_true',
+                    help="run without the GUI")
+args = parser.parse_args()
+
+# Log to the console from a background thread. Subsystems (plm, parser,
+# house, macro, gui) can have their own levels, for example
+# levels={'parser':'DEBUG'} traces every received message.
+log.configure(level='INFO')
 
 #Create house
 # You may need to change permissions on the USB port to run this
 #   sudo chmod 0777 /dev/ttyUSB0
-house = pyHome.House(usbport='/dev/ttyUSB0')
+# On Linux and other POSIX systems the PLM can wait on the port with select()
+# instead of polling it. Use io_mode='poll' on other platforms.
+# With several PLMs, pass a list of ports: usbport=['/dev/ttyUSB0','/dev/ttyUSB1']
+house = pyHome.House(usbport='/dev/ttyUSB0', io_mode='select',
+                     headless=args.headless)
+
+#Uncomment to log the main loop timing every 10 minutes
+#house.profiler.summary_interval = 600.
 
 #Start the house
 house.activate()